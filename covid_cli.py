@@ -0,0 +1,149 @@
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+
+# Pipeline modules live in scripts/ and import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+# Dependencies only some commands need; reported so a stray eager import shows up
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'sqlalchemy', 'requests']
+
+_import_times = {}
+
+def _import(name):
+    """Import a module, recording how long it took if it was not already loaded"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_times[name] = time.perf_counter() - start
+    return module
+
+def cmd_download(args):
+    data_download = _import('data_download')
+    return data_download.download_covid_data(concurrent=args.concurrent, compress=args.compress)
+
+def cmd_combine(args):
+    data_download = _import('data_download')
+    return data_download.create_combined_dataset(incremental=not args.full) is not None
+
+def cmd_sql(args):
+    covid_sql = _import('covid_sql')
+    return covid_sql.setup_covid_database()
+
+def _load_aggregates(covid_analysis):
+    """Load the analysis frame, reading only the latest date when the stored cube is current"""
+    cube = _import('covid_cube').open_current_cube()
+    df = covid_analysis.load_analysis_frame(cube)
+    covid_analysis.get_aggregates(df, cube)
+    return df
+
+def cmd_insights(args):
+    covid_analysis = _import('covid_analysis')
+    covid_analysis.generate_covid_insights(_load_aggregates(covid_analysis))
+    return True
+
+def cmd_charts(args):
+    covid_analysis = _import('covid_analysis')
+    df = _load_aggregates(covid_analysis)
+    result = covid_analysis.render_charts(df, workers=args.workers, force=args.force)
+    return result is not None
+
+def cmd_reports(args):
+    covid_analysis = _import('covid_analysis')
+    covid_cube = _import('covid_cube')
+    covid_storage = _import('covid_storage')
+    cube = covid_cube.open_current_cube(args.cube)
+    if cube is None:
+        # Missing, or built from an older version of the combined store
+        covid_cube.build_cube(covid_storage.load_combined(), args.cube, source=covid_storage.store_fingerprint())
+        cube = covid_cube.CovidCube(args.cube)
+    result = covid_analysis.render_report_pack(
+        cube, args.output, max_points=args.max_points, dpi=args.dpi,
+        workers=args.workers, force=args.force,
+    )
+    return result is not None
+
+def cmd_powerbi(args):
+    covid_powerbi = _import('covid_powerbi')
+    covid_powerbi.export_powerbi(columnar=args.columnar, full=args.full)
+    return True
+
+def cmd_all(args):
+    run_analysis = _import('run_analysis')
+    results = run_analysis.build_pipeline().run(force=args.force_stage or ())
+    for name, status in results.items():
+        print(f"  {name}: {status}")
+    return all(status in ('ran', 'skipped') for status in results.values())
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="COVID-19 data pipeline")
+    parser.add_argument('--trace', default=None, help="Record per-stage spans to this JSON-lines file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    download = commands.add_parser('download', help="Refresh the raw JHU time series")
+    download.add_argument('--concurrent', action='store_true', help="Fetch all files in parallel")
+    download.add_argument('--compress', action='store_true', help="Store the raw files gzip-compressed")
+    download.set_defaults(func=cmd_download)
+
+    combine = commands.add_parser('combine', help="Append new dates to the combined dataset")
+    combine.add_argument('--full', action='store_true', help="Rebuild from scratch instead of appending")
+    combine.set_defaults(func=cmd_combine)
+
+    sql = commands.add_parser('sql', help="Load the combined dataset into SQLite and print example queries")
+    sql.set_defaults(func=cmd_sql)
+
+    insights = commands.add_parser('insights', help="Print the insights report (no plotting imports)")
+    insights.set_defaults(func=cmd_insights)
+
+    charts = commands.add_parser('charts', help="Render the charts headlessly")
+    charts.add_argument('--force', action='store_true', help="Re-render unchanged figures too")
+    charts.add_argument('--workers', type=int, default=None, help="Render processes (default: one per figure)")
+    charts.set_defaults(func=cmd_charts)
+
+    reports = commands.add_parser('reports', help="Render a trend chart per country and province")
+    reports.add_argument('--cube', default='data/cube', help="Data cube to read (rebuilt if missing or stale)")
+    reports.add_argument('--output', default='outputs/reports')
+    reports.add_argument('--max-points', type=int, default=400, help="Points kept per series (default: 400)")
+    reports.add_argument('--dpi', type=int, default=150)
+    reports.add_argument('--force', action='store_true', help="Re-render unchanged locations too")
+    reports.add_argument('--workers', type=int, default=None, help="Render processes (default: one per CPU)")
+    reports.set_defaults(func=cmd_reports)
+
+    powerbi = commands.add_parser('powerbi', help="Append new dates to the Power BI star-schema export")
+    powerbi.add_argument('--columnar', action='store_true', help="Also write the tables as Parquet")
+    powerbi.add_argument('--full', action='store_true', help="Discard the previous export and rewrite it")
+    powerbi.set_defaults(func=cmd_powerbi)
+
+    everything = commands.add_parser('all', help="Run the full pipeline, skipping unchanged stages")
+    everything.add_argument('--force', dest='force_stage', action='append', metavar='STAGE',
+                            help="Re-run a stage even if its inputs are unchanged (repeatable)")
+    everything.set_defaults(func=cmd_all)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        os.environ['COVID_TRACE'] = args.trace
+        _import('covid_tracing').configure(args.trace)
+    startup = time.perf_counter() - _START
+
+    ok = args.func(args)
+
+    total = time.perf_counter() - _START
+    imports = sum(_import_times.values())
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"\n{args.command}: {'ok' if ok else 'failed'} in {total:.2f}s "
+          f"(startup {startup:.2f}s, imports {imports:.2f}s)")
+    for name, seconds in sorted(_import_times.items(), key=lambda item: -item[1]):
+        print(f"  import {name}: {seconds:.3f}s")
+    print(f"  heavy modules loaded: {', '.join(loaded) or 'none'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
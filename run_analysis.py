@@ -2,6 +2,11 @@ import subprocess
 import sys
 import os
 
+# Pipeline modules live in scripts/ and import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+from covid_tracing import configure, span
+
 def run_script(script_name):
     """Run a Python script and handle errors"""
     try:
@@ -14,8 +19,9 @@ def run_script(script_name):
             print(f"Script not found: {script_name}")
             return False
             
-        result = subprocess.run([sys.executable, script_name], 
-                              capture_output=True, text=True)
+        with span(f'script.{os.path.basename(script_name)}'):
+            result = subprocess.run([sys.executable, script_name], 
+                                  capture_output=True, text=True)
         
         if result.returncode == 0:
             print(f"{script_name} completed successfully")
@@ -30,6 +36,94 @@ def run_script(script_name):
         print(f"Failed to run {script_name}: {e}")
         return False
 
+def _store_files(root):
+    return sorted(os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names)
+
+def download_stage():
+    """Refresh the raw JHU files (conditional requests make no-change runs cheap)
+
+    If the download fails, existing raw files are reused as they are. Only when
+    there are none is the sample dataset written to the combined store; its
+    files then stand in for raw_files so the stages after download see a change.
+    """
+    from covid_storage import COMBINED_DIR
+    from data_download import DATASETS, create_sample_dataset, dataset_path, download_covid_data
+    raw_files = [dataset_path(data_type) for data_type in DATASETS]
+    if not download_covid_data(fallback=False):
+        if all(os.path.exists(path) for path in raw_files):
+            print("Using the existing raw files")
+        elif create_sample_dataset():
+            return {'raw_files': _store_files(COMBINED_DIR)}
+        else:
+            raise RuntimeError("download failed")
+    return {'raw_files': raw_files}
+
+def load_combined_stage(raw_files):
+    """Provide the stored combined dataset when the combine stage is skipped"""
+    from covid_storage import load_combined
+    return {'combined': load_combined()}
+
+def combine_stage(raw_files):
+    """Append new dates to the combined dataset and hand it on in memory"""
+    from covid_storage import has_columnar
+    from data_download import DATASETS, create_combined_dataset, dataset_path
+    if raw_files == [dataset_path(data_type) for data_type in DATASETS]:
+        if create_combined_dataset(incremental=True) is None:
+            raise RuntimeError("could not build combined dataset")
+    elif not has_columnar():
+        raise RuntimeError("no raw files and no stored combined dataset")
+    # The download fallback writes sample data straight to the combined store
+    return load_combined_stage(raw_files)
+
+def analysis_stage(combined, cube):
+    """Render charts headlessly and print insights from the in-memory dataset and cube"""
+    from covid_analysis import ANALYSIS_COLUMNS, run_covid_analysis
+    from covid_cube import CUBE_DIR, CovidCube
+    if not run_covid_analysis(combined[ANALYSIS_COLUMNS], headless=True, cube=CovidCube(CUBE_DIR)):
+        raise RuntimeError("analysis failed")
+    return {}
+
+def sql_stage(combined, cube):
+    """Upsert the in-memory dataset into SQLite and refresh the rollups and metrics"""
+    from covid_cube import CUBE_DIR, CovidCube
+    from covid_sql import setup_covid_database
+    if not setup_covid_database(combined, cube=CovidCube(CUBE_DIR)):
+        raise RuntimeError("database setup failed")
+    return {}
+
+def cube_stage(combined):
+    """Rebuild the memory-mapped (location x date) cube from the combined dataset"""
+    from covid_cube import build_cube, cube_files
+    from covid_storage import store_fingerprint
+    return {'cube': cube_files(build_cube(combined, source=store_fingerprint()))}
+
+def powerbi_stage(combined):
+    """Append new dates to the Power BI star-schema export"""
+    from covid_powerbi import export_powerbi, powerbi_files
+    export_powerbi(combined)
+    return {'powerbi': powerbi_files()}
+
+def build_pipeline():
+    """Declare the stages; analysis and sql also read the cube built from the combined dataset"""
+    from covid_pipeline import Pipeline, Stage
+    return Pipeline([
+        Stage('download', download_stage, outputs=['raw_files'], always_run=True),
+        Stage('combine', combine_stage, inputs=['raw_files'], outputs=['combined'],
+              load=load_combined_stage),
+        Stage('cube', cube_stage, inputs=['combined'], outputs=['cube']),
+        Stage('analysis', analysis_stage, inputs=['combined', 'cube']),
+        Stage('sql', sql_stage, inputs=['combined', 'cube']),
+        Stage('powerbi', powerbi_stage, inputs=['combined'], outputs=['powerbi']),
+    ])
+
+def run_scripts(scripts):
+    """Run each script in its own interpreter, one after another"""
+    success_count = 0
+    for script in scripts:
+        if run_script(script):
+            success_count += 1
+    return success_count
+
 if __name__ == "__main__":
     scripts = [
         "scripts/data_download.py",
@@ -38,26 +132,45 @@ if __name__ == "__main__":
         
     ]
     
+    # --trace=<path.jsonl> records per-stage spans; --profile=<span,names> adds cProfile dumps.
+    # Scripts run with --subprocess inherit these through the environment.
+    for arg in sys.argv[1:]:
+        if arg.startswith('--trace='):
+            os.environ['COVID_TRACE'] = arg.split('=', 1)[1]
+        elif arg.startswith('--profile='):
+            os.environ['COVID_PROFILE'] = arg.split('=', 1)[1]
+    if os.environ.get('COVID_TRACE'):
+        configure(os.environ['COVID_TRACE'],
+                  profile=[p for p in os.environ.get('COVID_PROFILE', '').split(',') if p])
+    
     print("STARTING COVID-19 DATA ANALYSIS PIPELINE")
     print("=" * 60)
     
-    success_count = 0
-    for script in scripts:
-        if run_script(script):
-            success_count += 1
+    if '--subprocess' in sys.argv:
+        success_count = run_scripts(scripts)
+        total = len(scripts)
+        unit = "scripts"
+    else:
+        results = build_pipeline().run(force=[a.split('=', 1)[1] for a in sys.argv if a.startswith('--force=')])
+        success_count = sum(status in ('ran', 'skipped') for status in results.values())
+        total = len(results)
+        unit = "stages"
+        for name, status in results.items():
+            print(f"  {name}: {status}")
     
     print("=" * 60)
     print("PIPELINE EXECUTION SUMMARY")
     print("=" * 60)
-    print(f"Successful: {success_count}/{len(scripts)} scripts")
+    print(f"Successful: {success_count}/{total} {unit}")
     
-    if success_count == len(scripts):
-        print("ALL SCRIPTS COMPLETED SUCCESSFULLY")
+    if success_count == total:
+        print("ALL STAGES COMPLETED SUCCESSFULLY")
         print("Check these folders for outputs:")
         print("  outputs/charts/ - COVID-19 visualizations")
         print("  data/ - SQL database and cleaned data")
-        print("  powerbi/ - Power BI ready dataset")
-        print("Next: Open Power BI Desktop and load powerbi/covid19_powerbi_ready.csv")
+        print("  powerbi/ - Power BI star schema (fact table plus dim_location/dim_date)")
+        print("Next: Open Power BI Desktop and load powerbi/covid19_powerbi_ready.csv,")
+        print("      relating LocationKey to dim_location.csv and DateKey to dim_date.csv")
     else:
-        print(f"{len(scripts) - success_count} script(s) failed")
-        print("Check the errors above and try running failed scripts individually")
\ No newline at end of file
+        print(f"{total - success_count} {unit[:-1]}(s) failed")
+        print("Check the errors above and try running failed scripts individually")
@@ -1,135 +1,545 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import re
+import hashlib
+import json
+import multiprocessing
+import time
+import weakref
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
-# Set style for better visualizations
-plt.style.use('default')
-sns.set_palette("husl")
+from covid_metrics import CountryMatrix, compute_forecast, compute_metrics, daily_new
+from covid_cube import open_current_cube
+from covid_storage import load_combined, load_latest
+from covid_tracing import span, traced
 
-def create_covid_visualizations(df, output_dir="outputs/charts"):
-    """Create comprehensive COVID-19 analysis visualizations"""
+# Columns the report needs from the combined dataset
+ANALYSIS_COLUMNS = ['Country/Region', 'Date', 'Confirmed', 'Deaths', 'Recovered', 'Active']
+
+METRICS = ['Confirmed', 'Deaths', 'Recovered', 'Active']
+
+class CovidAggregates:
+    """Per-country latest snapshot and global daily totals, computed once per dataset
+
+    Charts and insights read from these instead of re-filtering and re-grouping
+    the long frame each time they need a ranking or a series. With cube (a
+    CovidCube of the same data) the global daily totals and the country x date
+    matrix come from the cube, so df only needs the latest date's rows;
+    otherwise both are built from df, which must stay alive for the lazily
+    built matrix.
+    """
+
+    def __init__(self, df, cube=None):
+        self._df = weakref.ref(df)
+        self.cube = cube
+        self._matrix = None
+        with span('analysis.aggregates', rows_in=len(df)) as trace:
+            self.latest_date = df['Date'].max()
+            if cube is not None:
+                self.global_daily = pd.DataFrame({metric: cube.array(metric).sum(axis=0) for metric in METRICS},
+                                                 index=cube.dates.rename('Date'))
+            else:
+                self.global_daily = df.groupby('Date', sort=True)[METRICS].sum()
+
+            latest_data = df.loc[df['Date'] == self.latest_date, ['Country/Region'] + METRICS]
+            by_country = latest_data.groupby('Country/Region', observed=True)[METRICS].sum()
+            confirmed = by_country['Confirmed'].where(by_country['Confirmed'] > 0)
+            by_country['Mortality_Rate'] = (by_country['Deaths'] / confirmed * 100).fillna(0)
+            by_country['Recovery_Rate'] = (by_country['Recovered'] / confirmed * 100).fillna(0)
+            self.by_country = by_country.sort_values('Confirmed', ascending=False, kind='mergesort')
+            trace.rows_out = len(self.global_daily) + len(self.by_country)
+
+    @property
+    def matrix(self):
+        """Country x date matrices, built on first use"""
+        if self._matrix is None:
+            self._matrix = CountryMatrix.from_cube(self.cube) if self.cube is not None else CountryMatrix(self._df())
+        return self._matrix
+
+    def latest_metrics(self, min_confirmed=1000):
+        """Rolling and growth metrics on the latest date for countries past min_confirmed"""
+        metrics = compute_metrics(self.matrix)
+        latest = metrics[metrics['Date'] == self.latest_date].set_index('Country/Region')
+        confirmed = self.by_country['Confirmed']
+        return latest[latest.index.isin(confirmed[confirmed > min_confirmed].index)]
+
+    @property
+    def global_latest(self):
+        """Global totals on the latest date"""
+        return self.global_daily.loc[self.latest_date]
+
+    def top(self, metric, n=10):
+        """Return the n largest countries by a latest-snapshot metric"""
+        return self.by_country[metric].nlargest(n)
+
+# Aggregates for the most recently seen frame, keyed on its identity and shape
+_aggregate_cache = {}
+
+def get_aggregates(df, cube=None):
+    """Return cached CovidAggregates for df, recomputing when a different frame is passed
+
+    The cache is keyed on the frame object, its shape and its latest date; call
+    invalidate_aggregates() after modifying a frame in place. A cube passed for
+    an already cached frame is attached to its aggregates and used for the
+    country matrices.
+    """
+    key = (df.shape, df['Date'].max())
+    cached = _aggregate_cache.get('entry')
+    if cached is not None:
+        ref, cached_key, aggregates = cached
+        if ref() is df and cached_key == key:
+            if cube is not None and aggregates.cube is None:
+                aggregates.cube = cube
+            return aggregates
+    aggregates = CovidAggregates(df, cube)
+    _aggregate_cache['entry'] = (weakref.ref(df), key, aggregates)
+    return aggregates
+
+def load_analysis_frame(cube=None):
+    """Load the stored columns the charts and insights need
+
+    With a cube of the stored data only the latest date is read, since the
+    global daily totals and country matrices then come from the cube.
+    """
+    if cube is None:
+        return load_combined(columns=ANALYSIS_COLUMNS)
+    return load_latest(columns=ANALYSIS_COLUMNS)
+
+def invalidate_aggregates():
+    """Drop cached aggregates so the next call recomputes them"""
+    _aggregate_cache.clear()
+
+_plotting_modules = None
+
+def _plotting():
+    """Import matplotlib and seaborn on first use and apply the chart style
+
+    Kept out of module import so insights-only and SQL runs never load the
+    plotting stack.
+    """
+    global _plotting_modules
+    if _plotting_modules is None:
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        # Set style for better visualizations
+        plt.style.use('default')
+        sns.set_palette("husl")
+        _plotting_modules = plt, sns
+    return _plotting_modules
+
+def plot_top_countries(top_confirmed, top_deaths):
+    """Side-by-side bar charts of the top countries by confirmed cases and deaths"""
+    plt, sns = _plotting()
+    fig = plt.figure(figsize=(14, 8))
     
-    # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
+    # 1. Top 10 Countries by Total Confirmed Cases
+    plt.subplot(1, 2, 1)
+    sns.barplot(x=top_confirmed.values, y=top_confirmed.index)
+    plt.title('Top 10 Countries - Total Confirmed Cases', fontsize=14, fontweight='bold')
+    plt.xlabel('Confirmed Cases')
     
-    print("Creating COVID-19 visualizations...")
+    # 2. Top 10 Countries by Total Deaths
+    plt.subplot(1, 2, 2)
+    sns.barplot(x=top_deaths.values, y=top_deaths.index, palette='Reds')
+    plt.title('Top 10 Countries - Total Deaths', fontsize=14, fontweight='bold')
+    plt.xlabel('Deaths')
     
-    try:
-        # Filter to latest date for country-level analysis
-        latest_date = df['Date'].max()
-        latest_data = df[df['Date'] == latest_date]
-        
-        # 1. Top 10 Countries by Total Confirmed Cases
-        plt.figure(figsize=(14, 8))
-        top_countries = latest_data.groupby('Country/Region')['Confirmed'].sum().nlargest(10)
-        
-        plt.subplot(1, 2, 1)
-        sns.barplot(x=top_countries.values, y=top_countries.index)
-        plt.title('Top 10 Countries - Total Confirmed Cases', fontsize=14, fontweight='bold')
-        plt.xlabel('Confirmed Cases')
-        
-        # 2. Top 10 Countries by Total Deaths
-        plt.subplot(1, 2, 2)
-        top_deaths = latest_data.groupby('Country/Region')['Deaths'].sum().nlargest(10)
-        sns.barplot(x=top_deaths.values, y=top_deaths.index, palette='Reds')
-        plt.title('Top 10 Countries - Total Deaths', fontsize=14, fontweight='bold')
-        plt.xlabel('Deaths')
-        
-        plt.tight_layout()
-        plt.savefig(f'{output_dir}/top_countries_comparison.png', dpi=300, bbox_inches='tight')
-        plt.show()
-        print("Created: top_countries_comparison.png")
-        
-        # 3. Global Cases Over Time
-        plt.figure(figsize=(14, 10))
-        
-        # Aggregate global data by date
-        global_daily = df.groupby('Date').agg({
-            'Confirmed': 'sum',
-            'Deaths': 'sum', 
-            'Recovered': 'sum',
-            'Active': 'sum'
-        }).reset_index()
-        
-        plt.subplot(2, 2, 1)
-        plt.plot(global_daily['Date'], global_daily['Confirmed'], linewidth=2, label='Confirmed')
-        plt.title('Global Confirmed Cases Over Time', fontweight='bold')
-        plt.xlabel('Date')
-        plt.ylabel('Cases')
-        plt.legend()
-        plt.xticks(rotation=45)
-        
-        plt.subplot(2, 2, 2)
-        plt.plot(global_daily['Date'], global_daily['Deaths'], color='red', linewidth=2, label='Deaths')
-        plt.title('Global Deaths Over Time', fontweight='bold')
-        plt.xlabel('Date')
-        plt.ylabel('Deaths')
-        plt.legend()
-        plt.xticks(rotation=45)
-        
-        plt.subplot(2, 2, 3)
-        plt.plot(global_daily['Date'], global_daily['Recovered'], color='green', linewidth=2, label='Recovered')
-        plt.title('Global Recovered Cases Over Time', fontweight='bold')
-        plt.xlabel('Date')
-        plt.ylabel('Recovered')
-        plt.legend()
-        plt.xticks(rotation=45)
-        
-        plt.subplot(2, 2, 4)
-        plt.plot(global_daily['Date'], global_daily['Active'], color='orange', linewidth=2, label='Active')
-        plt.title('Global Active Cases Over Time', fontweight='bold')
+    plt.tight_layout()
+    return fig
+
+def plot_global_trends(global_daily):
+    """2x2 grid of global confirmed, deaths, recovered and active series"""
+    plt, _ = _plotting()
+    # 3. Global Cases Over Time
+    fig = plt.figure(figsize=(14, 10))
+    panels = [
+        ('Confirmed', None, 'Global Confirmed Cases Over Time', 'Cases'),
+        ('Deaths', 'red', 'Global Deaths Over Time', 'Deaths'),
+        ('Recovered', 'green', 'Global Recovered Cases Over Time', 'Recovered'),
+        ('Active', 'orange', 'Global Active Cases Over Time', 'Active Cases'),
+    ]
+    for position, (metric, color, title, ylabel) in enumerate(panels, 1):
+        plt.subplot(2, 2, position)
+        plt.plot(global_daily['Date'], global_daily[metric], color=color, linewidth=2, label=metric)
+        plt.title(title, fontweight='bold')
         plt.xlabel('Date')
-        plt.ylabel('Active Cases')
+        plt.ylabel(ylabel)
         plt.legend()
         plt.xticks(rotation=45)
-        
-        plt.tight_layout()
-        plt.savefig(f'{output_dir}/global_trends.png', dpi=300, bbox_inches='tight')
-        plt.show()
-        print("Created: global_trends.png")
-        
-        # 4. Mortality vs Recovery Rates Scatter Plot
-        plt.figure(figsize=(12, 8))
-        
+    
+    plt.tight_layout()
+    return fig
+
+def plot_mortality_recovery(country_rates):
+    """Scatter of mortality vs recovery rate, sized and coloured by confirmed cases"""
+    plt, _ = _plotting()
+    # 4. Mortality vs Recovery Rates Scatter Plot
+    fig = plt.figure(figsize=(12, 8))
+    
+    # Create scatter plot
+    scatter = plt.scatter(country_rates['Mortality_Rate'], country_rates['Recovery_Rate'], 
+                         s=country_rates['Confirmed']/10000, alpha=0.6, 
+                         c=country_rates['Confirmed'], cmap='viridis')
+    
+    # Add country labels for interesting points
+    for country in country_rates.index:
+        mortality = country_rates.loc[country, 'Mortality_Rate']
+        recovery = country_rates.loc[country, 'Recovery_Rate']
+        if mortality > 2 or recovery > 80:  # Label outliers
+            plt.annotate(country, (mortality, recovery), xytext=(5, 5), 
+                        textcoords='offset points', fontsize=8)
+    
+    plt.colorbar(scatter, label='Total Confirmed Cases')
+    plt.xlabel('Mortality Rate (%)')
+    plt.ylabel('Recovery Rate (%)')
+    plt.title('Mortality Rate vs Recovery Rate by Country', fontweight='bold')
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    return fig
+
+# Figure name -> (plot function, inputs taken from the shared aggregates)
+FIGURES = {
+    'top_countries_comparison': (plot_top_countries, lambda agg: {
+        'top_confirmed': agg.top('Confirmed', 10),
+        'top_deaths': agg.top('Deaths', 10),
+    }),
+    'global_trends': (plot_global_trends, lambda agg: {
+        'global_daily': agg.global_daily.reset_index(),
+    }),
+    'mortality_recovery_scatter': (plot_mortality_recovery, lambda agg: {
         # Calculate rates for top 20 countries by confirmed cases
-        country_rates = latest_data.groupby('Country/Region').agg({
-            'Confirmed': 'sum',
-            'Deaths': 'sum',
-            'Recovered': 'sum'
-        }).nlargest(20, 'Confirmed')
-        
-        country_rates['Mortality_Rate'] = (country_rates['Deaths'] / country_rates['Confirmed'] * 100).fillna(0)
-        country_rates['Recovery_Rate'] = (country_rates['Recovered'] / country_rates['Confirmed'] * 100).fillna(0)
-        
-        # Create scatter plot
-        scatter = plt.scatter(country_rates['Mortality_Rate'], country_rates['Recovery_Rate'], 
-                             s=country_rates['Confirmed']/10000, alpha=0.6, 
-                             c=country_rates['Confirmed'], cmap='viridis')
+        'country_rates': agg.by_country.nlargest(20, 'Confirmed'),
+    }),
+}
+
+DEFAULT_FIGURE_OPTIONS = {'dpi': 300, 'format': 'png'}
+
+NON_INTERACTIVE_BACKENDS = {'agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template'}
+
+def is_headless():
+    """Return True when matplotlib is running with a non-interactive backend"""
+    import matplotlib
+    return matplotlib.get_backend().lower() in NON_INTERACTIVE_BACKENDS
+
+def figure_fingerprint(name, inputs, options):
+    """Hash a figure's input aggregates and render options"""
+    digest = hashlib.sha256(f"{name}|{options['dpi']}|{options['format']}".encode())
+    for key in sorted(inputs):
+        value = inputs[key]
+        digest.update(key.encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest.update(repr(list(columns)).encode())
+    return digest.hexdigest()
+
+def _pool_context():
+    """Multiprocessing context for the render pools, avoiding fork
+
+    The pipeline runs other stages on threads while charts render; a forked
+    child would inherit any sqlite, pyarrow or BLAS lock they hold.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def render_figure(name, inputs, path, dpi, fmt):
+    """Render one figure to disk with the Agg backend; safe to run in a worker process"""
+    plt, _ = _plotting()
+    plt.switch_backend('Agg')
+    start = time.perf_counter()
+    plot_function = FIGURES[name][0]
+    fig = plot_function(**inputs)
+    fig.savefig(path, dpi=dpi, format=fmt, bbox_inches='tight')
+    plt.close(fig)
+    return name, time.perf_counter() - start
+
+@traced('analysis.charts')
+def render_charts(df, output_dir="outputs/charts", figure_options=None, workers=None, force=False):
+    """Render all figures headlessly, in parallel, skipping those whose inputs are unchanged
+
+    figure_options maps a figure name to {'dpi': ..., 'format': ...} overrides.
+    A manifest in output_dir stores each figure's input fingerprint; a figure is
+    re-rendered only when its fingerprint changes or its file is missing.
+    Returns a dict with rendered/skipped figure names and wall time.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    plt, _ = _plotting()
+    plt.switch_backend('Agg')
+    figure_options = figure_options or {}
+    manifest_path = os.path.join(output_dir, '.render_manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    
+    aggregates = get_aggregates(df)
+    jobs = []
+    skipped = []
+    for name, (_, select_inputs) in FIGURES.items():
+        options = {**DEFAULT_FIGURE_OPTIONS, **figure_options.get(name, {})}
+        inputs = select_inputs(aggregates)
+        path = os.path.join(output_dir, f"{name}.{options['format']}")
+        fingerprint = figure_fingerprint(name, inputs, options)
+        if not force and manifest.get(name) == fingerprint and os.path.exists(path):
+            skipped.append(name)
+            continue
+        jobs.append((name, inputs, path, options['dpi'], options['format'], fingerprint))
+    
+    rendered = {}
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1),
+                                 mp_context=_pool_context()) as pool:
+            futures = {pool.submit(render_figure, *job[:5]): job for job in jobs}
+            for future in as_completed(futures):
+                name, elapsed = future.result()
+                rendered[name] = elapsed
+                manifest[name] = futures[future][5]
+    else:
+        for job in jobs:
+            name, elapsed = render_figure(*job[:5])
+            rendered[name] = elapsed
+            manifest[name] = job[5]
+    
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    
+    for name, elapsed in rendered.items():
+        print(f"Created: {name} ({elapsed:.2f}s)")
+    for name in skipped:
+        print(f"Unchanged: {name}")
+    wall_time = time.perf_counter() - start
+    print(f"Rendered {len(rendered)} figure(s), skipped {len(skipped)} in {wall_time:.2f}s")
+    return {'rendered': sorted(rendered), 'skipped': skipped, 'seconds': wall_time}
+
+def lttb_indices(values, n_out):
+    """Largest-triangle-three-buckets point selection for every row of a (series x day) array
+
+    Returns a (series x n_out) array of column indices that keeps the first and
+    last day and, from each bucket in between, the day forming the largest
+    triangle with the previously kept point and the next bucket's mean, so
+    peaks and troughs survive decimation. Days are assumed evenly spaced.
+    All rows are processed together, one bucket at a time.
+    """
+    n_series, n_days = values.shape
+    if n_days <= n_out or n_out < 3:
+        return np.tile(np.arange(n_days), (n_series, 1))
+
+    rows = np.arange(n_series)
+    selected = np.empty((n_series, n_out), dtype='int64')
+    selected[:, 0] = 0
+    selected[:, -1] = n_days - 1
+    every = (n_days - 2) / (n_out - 2)
+    for bucket in range(n_out - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n_days)
+        mean_x = (end + next_end - 1) / 2
+        mean_y = values[:, end:next_end].mean(axis=1)
+
+        previous = selected[:, bucket]
+        previous_y = values[rows, previous]
+        candidates = np.arange(start, end)
+        area = np.abs(
+            (previous[:, None] - mean_x) * (values[:, start:end] - previous_y[:, None])
+            - (previous[:, None] - candidates) * (mean_y - previous_y)[:, None]
+        )
+        selected[:, bucket + 1] = start + area.argmax(axis=1)
+    return selected
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(text)).strip('_')
+
+_report_dates = None
+
+def _init_report_worker(dates):
+    global _report_dates
+    _report_dates = dates
+
+class LocationTrendFigure:
+    """One reusable figure for location trend charts
+
+    Building a figure dominates the cost of a small chart, so a render worker
+    creates this once and swaps the line data for each location.
+    """
+
+    def __init__(self, plt):
+        self.fig, (self.top, self.bottom) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+        self.deaths_axis = self.top.twinx()
+        self.confirmed_line, = self.top.plot([], [], linewidth=1.5, label='Confirmed')
+        self.deaths_line, = self.deaths_axis.plot([], [], color='red', linewidth=1.5, label='Deaths')
+        self.new_line, = self.bottom.plot([], [], color='tab:blue', linewidth=0.8)
+        self.new_fill = None
+        self.top.set_ylabel('Confirmed')
+        self.deaths_axis.set_ylabel('Deaths')
+        self.bottom.set_ylabel('New cases')
+
+    def draw(self, title, series, dates):
+        """Show one location's decimated series: {metric: (day indices, values)}"""
+        for line, metric in ((self.confirmed_line, 'Confirmed'), (self.deaths_line, 'Deaths'),
+                             (self.new_line, 'New_Confirmed')):
+            index, values = series[metric]
+            line.set_data(dates[index], values)
+        if self.new_fill is not None:
+            self.new_fill.remove()
+        index, values = series['New_Confirmed']
+        self.new_fill = self.bottom.fill_between(dates[index], values, color='tab:blue', alpha=0.4, linewidth=0)
+        for axis in (self.top, self.deaths_axis, self.bottom):
+            axis.relim()
+            axis.autoscale_view()
+        self.top.set_title(title, fontweight='bold')
+        # Tick label widths change with each location's scale, so lay out every chart
+        self.fig.autofmt_xdate()
+        self.fig.tight_layout()
+        return self.fig
+
+def render_location_charts(jobs, dpi, fmt):
+    """Render a batch of location charts on one reused figure; returns (name, seconds) per chart"""
+    plt, _ = _plotting()
+    plt.switch_backend('Agg')
+    figure = LocationTrendFigure(plt)
+    timings = []
+    for name, title, series, path in jobs:
+        start = time.perf_counter()
+        figure.draw(title, series, _report_dates).savefig(path, dpi=dpi, format=fmt)
+        timings.append((name, time.perf_counter() - start))
+    plt.close(figure.fig)
+    return timings
+
+REPORT_SERIES = ['Confirmed', 'Deaths', 'New_Confirmed']
+
+def _report_locations(cube):
+    """Yield (subdirectory, name, title, confirmed, deaths) per country and per province"""
+    countries, confirmed = cube.by_country('Confirmed')
+    _, deaths = cube.by_country('Deaths')
+    for i, country in enumerate(countries):
+        yield 'countries', _slug(country), country, confirmed[i], deaths[i]
+
+    locations = cube.locations
+    provinces = np.flatnonzero(locations['Province/State'].notna().to_numpy())
+    confirmed, deaths = cube.array('Confirmed'), cube.array('Deaths')
+    for row in provinces:
+        country, province = locations['Country/Region'].iat[row], locations['Province/State'].iat[row]
+        yield ('provinces', f"{_slug(country)}__{_slug(province)}", f"{province}, {country}",
+               confirmed[row], deaths[row])
+
+@traced('analysis.reports')
+def render_report_pack(cube, output_dir="outputs/reports", max_points=400, dpi=150, fmt='png',
+                       workers=None, batch_size=16, force=False):
+    """Render a trend chart for every country and province in a CovidCube
+
+    Each series is decimated to max_points with LTTB before plotting. A manifest
+    in output_dir stores a fingerprint of each location's full series and the
+    render options; only locations whose fingerprint changed (or whose file is
+    missing) are re-rendered, in batches across a process pool. Returns a dict
+    with rendered/skipped counts, total wall time and per-chart cost.
+    """
+    start = time.perf_counter()
+    manifest_path = os.path.join(output_dir, '.report_manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    options = f"{max_points}|{dpi}|{fmt}".encode()
+
+    pending = []
+    skipped = 0
+    for subdirectory, name, title, confirmed, deaths in _report_locations(cube):
+        key = f"{subdirectory}/{name}"
+        path = os.path.join(output_dir, subdirectory, f"{name}.{fmt}")
+        digest = hashlib.sha256(options)
+        digest.update(np.ascontiguousarray(confirmed, dtype='float64').tobytes())
+        digest.update(np.ascontiguousarray(deaths, dtype='float64').tobytes())
+        fingerprint = digest.hexdigest()
+        if not force and manifest.get(key) == fingerprint and os.path.exists(path):
+            skipped += 1
+            continue
+        pending.append((key, title, path, fingerprint, confirmed, deaths))
+
+    jobs = []
+    if pending:
+        confirmed = np.array([p[4] for p in pending], dtype='float64')
+        deaths = np.array([p[5] for p in pending], dtype='float64')
+        arrays = {'Confirmed': confirmed, 'Deaths': deaths, 'New_Confirmed': daily_new(confirmed)}
+        # Decimate every pending location at once, one metric at a time
+        selected = {metric: lttb_indices(values, max_points) for metric, values in arrays.items()}
+        for i, (key, title, path, _, _, _) in enumerate(pending):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            series = {metric: (selected[metric][i], arrays[metric][i, selected[metric][i]])
+                      for metric in REPORT_SERIES}
+            jobs.append((key, title, series, path))
+    fingerprints = {p[0]: p[3] for p in pending}
+
+    dates = cube.dates.to_numpy()
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    costs = {}
+    if len(batches) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers or min(len(batches), os.cpu_count() or 1),
+                                 initializer=_init_report_worker, initargs=(dates,),
+                                 mp_context=_pool_context()) as pool:
+            futures = [pool.submit(render_location_charts, batch, dpi, fmt) for batch in batches]
+            for future in as_completed(futures):
+                for name, seconds in future.result():
+                    costs[name] = seconds
+                    manifest[name] = fingerprints[name]
+    else:
+        _init_report_worker(dates)
+        for batch in batches:
+            for name, seconds in render_location_charts(batch, dpi, fmt):
+                costs[name] = seconds
+                manifest[name] = fingerprints[name]
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    wall_time = time.perf_counter() - start
+    result = {'rendered': len(costs), 'skipped': skipped, 'seconds': wall_time}
+    print(f"Report pack: rendered {len(costs)} chart(s), skipped {skipped} unchanged in {wall_time:.2f}s")
+    if costs:
+        per_chart = np.array(list(costs.values()))
+        slowest = max(costs, key=costs.get)
+        result.update({
+            'chart_seconds_total': float(per_chart.sum()),
+            'chart_seconds_mean': float(per_chart.mean()),
+            'chart_seconds_p50': float(np.median(per_chart)),
+            'chart_seconds_max': float(per_chart.max()),
+        })
+        print(f"Per chart: mean {per_chart.mean():.3f}s, median {np.median(per_chart):.3f}s, "
+              f"max {per_chart.max():.3f}s ({slowest}); {per_chart.sum():.2f}s of render time in total")
+    return result
+
+def create_covid_visualizations(df, output_dir="outputs/charts", headless=False, **render_options):
+    """Create comprehensive COVID-19 analysis visualizations
+
+    With headless=True the figures go through render_charts (Agg backend, process
+    pool, skip-if-unchanged) and nothing is shown on screen.
+    """
+    
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+    
+    print("Creating COVID-19 visualizations...")
+    
+    try:
+        if headless:
+            return render_charts(df, output_dir, **render_options)
         
-        # Add country labels for interesting points
-        for country in country_rates.index:
-            mortality = country_rates.loc[country, 'Mortality_Rate']
-            recovery = country_rates.loc[country, 'Recovery_Rate']
-            if mortality > 2 or recovery > 80:  # Label outliers
-                plt.annotate(country, (mortality, recovery), xytext=(5, 5), 
-                            textcoords='offset points', fontsize=8)
+        plt, _ = _plotting()
+        # Country snapshots and global series shared with the insights report
+        aggregates = get_aggregates(df)
         
-        plt.colorbar(scatter, label='Total Confirmed Cases')
-        plt.xlabel('Mortality Rate (%)')
-        plt.ylabel('Recovery Rate (%)')
-        plt.title('Mortality Rate vs Recovery Rate by Country', fontweight='bold')
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(f'{output_dir}/mortality_recovery_scatter.png', dpi=300, bbox_inches='tight')
-        plt.show()
-        print("Created: mortality_recovery_scatter.png")
+        for name, (plot_function, select_inputs) in FIGURES.items():
+            fig = plot_function(**select_inputs(aggregates))
+            fig.savefig(f'{output_dir}/{name}.png', dpi=300, bbox_inches='tight')
+            plt.show()
+            print(f"Created: {name}.png")
         
     except Exception as e:
         print(f"Error creating visualizations: {e}")
 
+@traced('analysis.insights')
 def generate_covid_insights(df):
     """Generate key insights from COVID-19 data"""
     
@@ -138,14 +548,15 @@ def generate_covid_insights(df):
     print("="*60)
     
     try:
-        latest_date = df['Date'].max()
-        latest_data = df[df['Date'] == latest_date]
+        aggregates = get_aggregates(df)
+        latest_date = aggregates.latest_date
         
         # Global totals
-        total_confirmed = latest_data['Confirmed'].sum()
-        total_deaths = latest_data['Deaths'].sum()
-        total_recovered = latest_data['Recovered'].sum()
-        total_active = latest_data['Active'].sum()
+        totals = aggregates.global_latest
+        total_confirmed = totals['Confirmed']
+        total_deaths = totals['Deaths']
+        total_recovered = totals['Recovered']
+        total_active = totals['Active']
         
         # Global rates
         global_mortality_rate = (total_deaths / total_confirmed * 100) if total_confirmed > 0 else 0
@@ -161,8 +572,8 @@ def generate_covid_insights(df):
         print(f"  Global Recovery Rate: {global_recovery_rate:.2f}%")
         
         # Country rankings
-        top_5_confirmed = latest_data.groupby('Country/Region')['Confirmed'].sum().nlargest(5)
-        top_5_deaths = latest_data.groupby('Country/Region')['Deaths'].sum().nlargest(5)
+        top_5_confirmed = aggregates.top('Confirmed', 5)
+        top_5_deaths = aggregates.top('Deaths', 5)
         
         print(f"Top 5 Countries by Confirmed Cases:")
         for i, (country, cases) in enumerate(top_5_confirmed.items(), 1):
@@ -170,32 +581,57 @@ def generate_covid_insights(df):
             
         print(f"Top 5 Countries by Deaths:")
         for i, (country, deaths) in enumerate(top_5_deaths.items(), 1):
-            mortality_rate = (deaths / top_5_confirmed.get(country, 1) * 100) if top_5_confirmed.get(country, 0) > 0 else 0
+            mortality_rate = aggregates.by_country.loc[country, 'Mortality_Rate']
             print(f"  {i}. {country}: {deaths:,} deaths ({mortality_rate:.2f}% mortality)")
         
+        # Growth and short-term outlook
+        latest_metrics = aggregates.latest_metrics()
+        fastest = latest_metrics['Growth_Rate'].dropna().nlargest(5)
+        print(f"Fastest Growing Countries (7-day average daily growth):")
+        for i, (country, rate) in enumerate(fastest.items(), 1):
+            doubling = latest_metrics.loc[country, 'Doubling_Time']
+            print(f"  {i}. {country}: {rate:.2f}%/day (doubling in {doubling:,.0f} days)")
+        
+        outlook = compute_forecast(aggregates.matrix, horizon=14)
+        projected = outlook.groupby('Date')['Forecast_Confirmed'].sum()
+        print(f"14-Day Global Forecast: {projected.iloc[-1]:,.0f} confirmed cases by {projected.index[-1]:%Y-%m-%d}")
+        
     except Exception as e:
         print(f"Error generating insights: {e}")
 
-if __name__ == "__main__":
-    print("Starting COVID-19 Data Analysis")
-    
+def run_covid_analysis(df=None, headless=None, cube=None):
+    """Load the combined dataset if needed, then chart it and print insights
+
+    cube, a CovidCube of the same data, is used for the daily totals and country
+    matrices; when the dataset is loaded here and the stored cube is current,
+    only the latest date is read from the store.
+    """
     try:
         # Load combined dataset
-        df = pd.read_csv("data/covid19_combined_global.csv")
-        df['Date'] = pd.to_datetime(df['Date'])
+        if df is None:
+            cube = cube or open_current_cube()
+            df = load_analysis_frame(cube)
+        # Charts and insights share these aggregates
+        aggregates = get_aggregates(df, cube)
         
         print("COVID-19 data loaded successfully")
         print(f"Dataset shape: {df.shape}")
-        print(f"Date range: {df['Date'].min()} to {df['Date'].max()}")
+        print(f"Date range: {aggregates.global_daily.index.min()} to {aggregates.latest_date}")
         print(f"Countries: {df['Country/Region'].nunique()}")
         
         # Create visualizations and generate insights
-        create_covid_visualizations(df)
+        create_covid_visualizations(df, headless=is_headless() if headless is None else headless)
         generate_covid_insights(df)
         
         print("COVID-19 analysis completed successfully")
+        return True
         
     except FileNotFoundError:
         print("Combined data file not found. Please run data_download.py first.")
     except Exception as e:
-        print(f"Error in analysis: {e}")
\ No newline at end of file
+        print(f"Error in analysis: {e}")
+    return False
+
+if __name__ == "__main__":
+    print("Starting COVID-19 Data Analysis")
+    run_covid_analysis()
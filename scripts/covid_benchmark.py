@@ -0,0 +1,231 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_download import DATASETS
+
+# Label -> (countries, provinces per country, days)
+SIZES = {
+    'small': (20, 1, 180),
+    'medium': (100, 3, 600),
+    'large': (200, 5, 1100),
+}
+
+STAGES = ['combine', 'sql', 'charts', 'insights']
+
+# Outputs a stage would otherwise reuse on a repeat (the SQL upsert skips unchanged
+# dates), removed before every run so each repeat times the same full load
+STAGE_STATE = {
+    'sql': ['data/covid19_database.db', 'data/covid19_database.db-wal', 'data/covid19_database.db-shm'],
+}
+
+def parse_size(value):
+    """Parse a size label or a COUNTRIESxPROVINCESxDAYS spec such as 50x2x365"""
+    if value in SIZES:
+        return value, SIZES[value]
+    try:
+        countries, provinces, days = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size {value!r}; use one of {list(SIZES)} or CxPxD")
+    return value, (countries, provinces, days)
+
+def generate_wide_fixtures(n_countries, n_provinces, n_days, data_dir='data', seed=42):
+    """Write JHU-shaped wide confirmed/deaths/recovered CSVs for offline benchmarking
+
+    Locations with more than one province get named provinces, like the real
+    files; cumulative counts never decrease. Recovered rows are missing for a few
+    locations so the combine step exercises its fill path.
+    """
+    rng = np.random.default_rng(seed)
+    n_locations = n_countries * n_provinces
+    dates = pd.date_range('2020-01-22', periods=n_days, freq='D')
+    date_columns = [f"{d.month}/{d.day}/{d.year % 100}" for d in dates]
+
+    countries = np.repeat([f"Country_{i + 1:03d}" for i in range(n_countries)], n_provinces)
+    if n_provinces > 1:
+        provinces = np.tile([f"Province_{i + 1:03d}" for i in range(n_provinces)], n_countries)
+    else:
+        provinces = np.full(n_locations, np.nan, dtype=object)
+    ids = pd.DataFrame({
+        'Province/State': provinces,
+        'Country/Region': countries,
+        'Lat': rng.uniform(-60, 70, n_locations).round(4),
+        'Long': rng.uniform(-180, 180, n_locations).round(4),
+    })
+
+    scale = rng.uniform(10, 2000, (n_locations, 1))
+    new_confirmed = rng.poisson(scale, (n_locations, n_days))
+    new_deaths = rng.binomial(new_confirmed, 0.02)
+    new_recovered = rng.binomial(new_confirmed - new_deaths, 0.85)
+    values = {
+        'confirmed': new_confirmed.cumsum(axis=1),
+        'deaths': new_deaths.cumsum(axis=1),
+        'recovered': new_recovered.cumsum(axis=1),
+    }
+
+    os.makedirs(data_dir, exist_ok=True)
+    keep = np.ones(n_locations, dtype=bool)
+    keep[::50] = False
+    for data_type in DATASETS:
+        wide = pd.concat([ids, pd.DataFrame(values[data_type], columns=date_columns)], axis=1)
+        if data_type == 'recovered':
+            wide = wide[keep]
+        wide.to_csv(os.path.join(data_dir, f'covid19_{data_type}_global.csv'), index=False)
+    return n_locations * n_days
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _run_stage(stage, workdir):
+    """Run one stage in a fresh process and return (seconds, peak RSS in MB)"""
+    os.chdir(workdir)
+    os.environ['MPLBACKEND'] = 'Agg'
+    import covid_analysis
+    import covid_sql
+    import data_download
+    from covid_storage import load_combined
+
+    for path in STAGE_STATE.get(stage, []):
+        if os.path.exists(path):
+            os.remove(path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage in ('charts', 'insights'):
+            df = load_combined(columns=covid_analysis.ANALYSIS_COLUMNS)
+        start = time.perf_counter()
+        if stage == 'combine':
+            ok = data_download.create_combined_dataset() is not None
+        elif stage == 'sql':
+            ok = covid_sql.setup_covid_database()
+        elif stage == 'charts':
+            ok = bool(covid_analysis.render_charts(df, workers=1, force=True)['rendered'])
+        elif stage == 'insights':
+            covid_analysis.generate_covid_insights(df)
+            ok = True
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+        elapsed = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError(f"Stage {stage} failed")
+    return elapsed, _peak_rss_mb()
+
+def run_benchmarks(sizes, stages=STAGES, repeat=1):
+    """Benchmark each stage at each size, returning a JSON-serialisable result dict
+
+    Every stage run gets its own spawned process so its peak RSS is its own.
+    Fixtures are generated offline into a temporary directory per size.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for label, (countries, provinces, days) in sizes:
+        with tempfile.TemporaryDirectory(prefix='covid-bench-') as workdir:
+            rows = generate_wide_fixtures(countries, provinces, days, os.path.join(workdir, 'data'))
+            print(f"{label}: {countries} countries x {provinces} provinces x {days} days = {rows:,} rows")
+            for stage in stages:
+                timings = []
+                peak = 0.0
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        seconds, rss = pool.submit(_run_stage, stage, workdir).result()
+                    timings.append(seconds)
+                    peak = max(peak, rss)
+                result = {
+                    'size': label,
+                    'countries': countries,
+                    'provinces': provinces,
+                    'days': days,
+                    'rows': rows,
+                    'stage': stage,
+                    'seconds': min(timings),
+                    'peak_rss_mb': round(peak, 1),
+                }
+                results.append(result)
+                print(f"  {stage:<10} {result['seconds']:8.3f}s  {result['peak_rss_mb']:8.1f} MB")
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare_results(baseline, current, threshold=0.2):
+    """Return a list of regressions where time or peak RSS grew by more than threshold"""
+    key = lambda r: (r['size'], r['stage'])
+    baseline_by_key = {key(r): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = baseline_by_key.get(key(result))
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            if previous[metric] > 0 and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append({
+                    'size': result['size'],
+                    'stage': result['stage'],
+                    'metric': metric,
+                    'baseline': previous[metric],
+                    'current': result[metric],
+                    'change': result[metric] / previous[metric] - 1,
+                })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the COVID-19 pipeline stages on synthetic data")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks and write JSON results")
+    run_parser.add_argument('--sizes', nargs='+', type=parse_size, default=[parse_size('small')],
+                            help=f"Sizes to run: {', '.join(SIZES)} or CxPxD (default: small)")
+    run_parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    run_parser.add_argument('--repeat', type=int, default=1, help="Runs per stage; the fastest is kept")
+    run_parser.add_argument('--output', default='outputs/benchmarks/results.json')
+
+    compare_parser = commands.add_parser('compare', help="Flag regressions against a baseline")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help="Allowed relative growth before flagging (default: 0.2)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.sizes, args.stages, args.repeat)
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved benchmark results: {args.output}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare_results(baseline, current, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r['size']}/{r['stage']} {r['metric']}: "
+              f"{r['baseline']} -> {r['current']} ({r['change']:+.0%})")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from covid_storage import COMBINED_DIR, store_fingerprint
+from covid_tracing import span
+
+CUBE_DIR = 'data/cube'
+
+LOCATION_COLUMNS = ['Province/State', 'Country/Region', 'Lat', 'Long']
+
+# Metric -> on-disk dtype; counts fit comfortably in int64, rates need no more than float32
+CUBE_METRICS = {
+    'Confirmed': 'int64',
+    'Deaths': 'int64',
+    'Recovered': 'int64',
+    'Active': 'int64',
+    'New_Confirmed': 'int64',
+    'New_Deaths': 'int64',
+    'New_Recovered': 'int64',
+    'Mortality_Rate': 'float32',
+    'Recovery_Rate': 'float32',
+}
+
+def build_cube(df, root=CUBE_DIR, source=None):
+    """Write the combined dataset as a dense (location x date) array per metric
+
+    Each metric is one C-ordered .npy file, so a location's full series is
+    contiguous and a single date is a strided column. The location and date keys
+    go into small dimension tables (locations.parquet, dates.parquet) whose row
+    number is the array index. Location/date pairs missing from df are 0.
+    source is recorded in cube.json; pass the combined store's
+    store_fingerprint() so open_current_cube() can tell when the cube is stale.
+    """
+    with span('cube.build', rows_in=len(df)) as trace:
+        keys = df[LOCATION_COLUMNS]
+        location_codes, locations = pd.factorize(pd.MultiIndex.from_frame(keys), sort=False)
+        date_codes, dates = pd.factorize(pd.to_datetime(df['Date']), sort=True)
+        n_locations, n_dates = len(locations), len(dates)
+
+        tmp_root = root.rstrip('/') + '.tmp'
+        if os.path.exists(tmp_root):
+            shutil.rmtree(tmp_root)
+        os.makedirs(tmp_root)
+
+        location_table = locations.to_frame(index=False, name=LOCATION_COLUMNS)
+        location_table.index.name = 'location_id'
+        location_table.reset_index().to_parquet(os.path.join(tmp_root, 'locations.parquet'), index=False)
+        dates = pd.DatetimeIndex(dates)
+        pd.DataFrame({
+            'date_id': np.arange(n_dates),
+            'Date': dates,
+            'Year': dates.year.astype('int16'),
+            'Month': dates.month.astype('int8'),
+            'DayOfWeek': dates.day_name(),
+        }).to_parquet(os.path.join(tmp_root, 'dates.parquet'), index=False)
+
+        written = []
+        for metric, dtype in CUBE_METRICS.items():
+            if metric not in df.columns:
+                continue
+            array = np.lib.format.open_memmap(
+                os.path.join(tmp_root, f'{metric}.npy'), mode='w+', dtype=dtype, shape=(n_locations, n_dates)
+            )
+            array[location_codes, date_codes] = df[metric].to_numpy().astype(dtype)
+            array.flush()
+            del array
+            written.append(metric)
+
+        with open(os.path.join(tmp_root, 'cube.json'), 'w') as f:
+            json.dump({'metrics': written, 'shape': [n_locations, n_dates], 'source': source}, f)
+
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.replace(tmp_root, root)
+        trace.rows_out = n_locations * n_dates
+    print(f"Saved data cube: {root}/ ({n_locations} locations x {n_dates} dates x {len(written)} metrics)")
+    return root
+
+class CovidCube:
+    """Read-only view of a data cube on disk
+
+    Metric arrays are memory-mapped, so opening is cheap, slices are views
+    that read only the pages they touch, and every process that opens the same
+    cube shares one copy through the OS page cache.
+    """
+
+    def __init__(self, root=CUBE_DIR):
+        self.root = root
+        with open(os.path.join(root, 'cube.json')) as f:
+            meta = json.load(f)
+        self.metrics = meta['metrics']
+        self.source = meta.get('source')
+        self.locations = pd.read_parquet(os.path.join(root, 'locations.parquet')).set_index('location_id')
+        date_table = pd.read_parquet(os.path.join(root, 'dates.parquet')).set_index('date_id')
+        self.date_table = date_table
+        self.dates = pd.DatetimeIndex(date_table['Date'])
+        self._arrays = {}
+
+    def array(self, metric):
+        """The full (location x date) memory-mapped array for a metric"""
+        if metric not in self._arrays:
+            if metric not in self.metrics:
+                raise KeyError(f"Metric not in cube: {metric}")
+            self._arrays[metric] = np.load(os.path.join(self.root, f'{metric}.npy'), mmap_mode='r')
+        return self._arrays[metric]
+
+    def date_index(self, date):
+        """Array column for a date; raises KeyError if the cube does not cover it"""
+        return self.dates.get_loc(pd.Timestamp(date))
+
+    def location_index(self, country, province=None):
+        """Array row for a country (and province, if the country is split into provinces)"""
+        locations = self.locations
+        mask = locations['Country/Region'] == country
+        if province is None:
+            mask &= locations['Province/State'].isna()
+        else:
+            mask &= locations['Province/State'] == province
+        matches = locations.index[mask]
+        if len(matches) == 0:
+            raise KeyError(f"Location not in cube: {country!r}, {province!r}")
+        return int(matches[0])
+
+    def on_date(self, metric, date):
+        """Values of a metric for every location on one date (a strided view)"""
+        return self.array(metric)[:, self.date_index(date)]
+
+    def latest(self, metric):
+        """Values of a metric for every location on the last date"""
+        return self.array(metric)[:, -1]
+
+    def series(self, metric, location):
+        """One location's full series for a metric (a contiguous view)"""
+        return self.array(metric)[location]
+
+    def frame(self, metric):
+        """The metric as a DataFrame (locations x dates) wrapping the memory map without copying"""
+        return pd.DataFrame(self.array(metric), index=self.locations.index, columns=self.dates, copy=False)
+
+    def by_country(self, metric):
+        """Sum a metric over provinces into (country x date), returning (countries, array)"""
+        codes, countries = pd.factorize(self.locations['Country/Region'], sort=True)
+        totals = np.zeros((len(countries), len(self.dates)), dtype='float64')
+        np.add.at(totals, codes, self.array(metric))
+        return pd.Index(countries, name='Country/Region'), totals
+
+def open_current_cube(root=CUBE_DIR, store=COMBINED_DIR):
+    """Open the cube if it was built from the current combined store, else return None"""
+    if not os.path.exists(os.path.join(root, 'cube.json')):
+        return None
+    cube = CovidCube(root)
+    source = store_fingerprint(store)
+    if source is None or cube.source != source:
+        return None
+    return cube
+
+def cube_files(root=CUBE_DIR):
+    """Paths of every file in a cube, for fingerprinting"""
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))]
+
+if __name__ == "__main__":
+    from covid_storage import load_combined
+    build_cube(load_combined(), source=store_fingerprint())
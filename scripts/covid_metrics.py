@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+METRICS = ['Confirmed', 'Deaths', 'Recovered']
+
+class CountryMatrix:
+    """Cumulative metrics pivoted once into (country x date) arrays
+
+    Province rows are summed into their country. Every function below works on
+    whole arrays, so all countries are computed together. Assumes each country
+    has a row for every date, as the JHU series do.
+    """
+
+    def __init__(self, df, metrics=METRICS, by='Country/Region'):
+        codes, locations = pd.factorize(df[by], sort=True)
+        date_codes, dates = pd.factorize(df['Date'], sort=True)
+        self.locations = pd.Index(locations, name=by)
+        self.dates = pd.DatetimeIndex(dates, name='Date')
+        n_locations, n_days = len(self.locations), len(self.dates)
+        flat = codes * n_days + date_codes
+        self.values = {
+            metric: np.bincount(flat, weights=df[metric].to_numpy(dtype='float64'),
+                                minlength=n_locations * n_days).reshape(n_locations, n_days)
+            for metric in metrics if metric in df.columns
+        }
+
+    @classmethod
+    def from_cube(cls, cube, metrics=METRICS):
+        """Build the country matrix from a CovidCube without going through a long frame"""
+        matrix = cls.__new__(cls)
+        matrix.dates = pd.DatetimeIndex(cube.dates, name='Date')
+        matrix.values = {}
+        for metric in metrics:
+            if metric in cube.metrics:
+                matrix.locations, matrix.values[metric] = cube.by_country(metric)
+        return matrix
+
+    def __getitem__(self, metric):
+        return self.values[metric]
+
+    def frame(self, metric):
+        """Return one metric as a DataFrame indexed by location with a column per date"""
+        return pd.DataFrame(self.values[metric], index=self.locations, columns=self.dates)
+
+def daily_new(cumulative):
+    """Day-over-day change of a cumulative series; the first day is 0"""
+    new = np.zeros_like(cumulative)
+    np.subtract(cumulative[:, 1:], cumulative[:, :-1], out=new[:, 1:])
+    return new
+
+def rolling_mean(values, window):
+    """Trailing mean over window days along the date axis; NaN until the window fills"""
+    cumsum = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumsum[:, 1:])
+    out = np.full(values.shape, np.nan)
+    out[:, window - 1:] = (cumsum[:, window:] - cumsum[:, :-window]) / window
+    return out
+
+def growth_rate(cumulative, window=7):
+    """Compound daily growth of the cumulative series over the trailing window"""
+    out = np.full(cumulative.shape, np.nan)
+    previous = cumulative[:, :-window]
+    current = cumulative[:, window:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(previous > 0, current / previous, np.nan)
+        out[:, window:] = ratio ** (1.0 / window) - 1
+    return out
+
+def doubling_time(rate):
+    """Days for the cumulative series to double at a daily growth rate; NaN if not growing"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(rate > 0, np.log(2) / np.log1p(rate), np.nan)
+
+def lagged_cfr(deaths, confirmed, lag=14):
+    """Deaths today as a percentage of cases confirmed lag days earlier"""
+    out = np.full(deaths.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        past = confirmed[:, :-lag] if lag else confirmed
+        out[:, lag:] = np.where(past > 0, deaths[:, lag:] / past * 100, np.nan)
+    return out
+
+def forecast(cumulative, horizon=14, window=14, method='exponential'):
+    """Project each row horizon days ahead from a least-squares fit of its last window days
+
+    method='exponential' fits a line to log cases, 'linear' to the cases
+    themselves. Projections never fall below the last observed value.
+    """
+    recent = cumulative[:, -window:]
+    t = np.arange(recent.shape[1], dtype='float64')
+    if method == 'exponential':
+        y = np.log(np.maximum(recent, 1.0))
+    elif method == 'linear':
+        y = recent
+    else:
+        raise ValueError(f"Unknown forecast method: {method}")
+
+    t_centered = t - t.mean()
+    y_mean = y.mean(axis=1)
+    slope = (y - y_mean[:, None]) @ t_centered / (t_centered ** 2).sum()
+    intercept = y_mean - slope * t.mean()
+    future = t[-1] + np.arange(1, horizon + 1)
+    projected = intercept[:, None] + slope[:, None] * future
+    if method == 'exponential':
+        projected = np.exp(projected)
+    return np.maximum(projected, cumulative[:, -1:])
+
+def _long(matrix, columns):
+    """Flatten (location x date) arrays into a long frame keyed by location and date"""
+    n_locations, n_days = len(matrix.locations), len(matrix.dates)
+    frame = pd.DataFrame({
+        matrix.locations.name: np.repeat(matrix.locations.to_numpy(), n_days),
+        'Date': np.tile(matrix.dates.to_numpy(), n_locations),
+    })
+    for name, values in columns.items():
+        frame[name] = values.ravel()
+    return frame
+
+def compute_metrics(matrix, windows=(7, 14), growth_window=7, cfr_lag=14):
+    """Rolling averages, growth, doubling time and lagged CFR for every location and date"""
+    new_confirmed = daily_new(matrix['Confirmed'])
+    new_deaths = daily_new(matrix['Deaths'])
+    columns = {}
+    for window in windows:
+        columns[f'New_Confirmed_{window}d'] = rolling_mean(new_confirmed, window)
+        columns[f'New_Deaths_{window}d'] = rolling_mean(new_deaths, window)
+    rate = growth_rate(matrix['Confirmed'], growth_window)
+    columns['Growth_Rate'] = rate * 100
+    columns['Doubling_Time'] = doubling_time(rate)
+    columns[f'CFR_Lag{cfr_lag}'] = lagged_cfr(matrix['Deaths'], matrix['Confirmed'], cfr_lag)
+    return _long(matrix, columns)
+
+def compute_forecast(matrix, metric='Confirmed', horizon=14, window=14, method='exponential'):
+    """Short-term forecast of a cumulative metric for every location as a long frame"""
+    projected = forecast(matrix[metric], horizon=horizon, window=window, method=method)
+    n_locations = len(matrix.locations)
+    future_dates = matrix.dates[-1] + pd.to_timedelta(np.arange(1, horizon + 1), unit='D')
+    return pd.DataFrame({
+        matrix.locations.name: np.repeat(matrix.locations.to_numpy(), horizon),
+        'Date': np.tile(future_dates.to_numpy(), n_locations),
+        f'Forecast_{metric}': projected.ravel(),
+        'Method': method,
+    })
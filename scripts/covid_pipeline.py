@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from covid_tracing import span
+
+STATE_PATH = 'data/pipeline_state.json'
+
+class Stage:
+    """One pipeline step: a function from named input artifacts to named output artifacts
+
+    func receives the inputs as keyword arguments and returns a dict holding every
+    name in outputs. Outputs that are file paths (or lists of paths) are
+    fingerprinted by content; anything else, such as a DataFrame, by the stage's
+    own input fingerprint. When a stage is skipped, its outputs are provided by
+    load() instead, called only if a stage that does run needs them.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), load=None, always_run=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.load = load
+        self.always_run = always_run
+
+class LazyArtifact:
+    """Output of a skipped stage, loaded only if a stage that runs asks for it"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+
+    def resolve(self):
+        with self._lock:
+            if not self._loaded:
+                self._value = self._loader()
+                self._loaded = True
+        return self._value
+
+def file_fingerprint(paths):
+    """SHA-256 over the content of one or more files"""
+    if isinstance(paths, str):
+        paths = [paths]
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(path.encode())
+        if not os.path.exists(path):
+            digest.update(b'<missing>')
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def _is_paths(value):
+    return isinstance(value, str) or (
+        isinstance(value, (list, tuple)) and value and all(isinstance(v, str) for v in value)
+    )
+
+class Pipeline:
+    """In-process DAG scheduler with skip-if-inputs-unchanged
+
+    Stages run on a thread pool as soon as all their inputs are available, so
+    stages that only depend on the same upstream output run in parallel.
+    Artifacts are passed between stages in memory. A stage is skipped when the
+    fingerprints of its inputs match those recorded after its last successful run.
+    """
+
+    def __init__(self, stages, state_path=STATE_PATH, max_workers=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Artifact {output!r} produced by both "
+                                     f"{self.producers[output]!r} and {stage.name!r}")
+                self.producers[output] = stage.name
+        for stage in stages:
+            unknown = [i for i in stage.inputs if i not in self.producers]
+            if unknown:
+                raise ValueError(f"Stage {stage.name!r} has no producer for {unknown}")
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def _dependencies(self, stage):
+        return {self.producers[i] for i in stage.inputs}
+
+    def run(self, force=()):
+        """Run every stage, returning {stage name: 'ran' | 'skipped' | 'failed' | 'blocked'}"""
+        state = self._load_state()
+        artifacts = {}
+        fingerprints = {}
+        results = {}
+        timings = {}
+        pending = dict(self.stages)
+        running = {}
+
+        def input_fingerprint(stage):
+            digest = hashlib.sha256(stage.name.encode())
+            for name in stage.inputs:
+                digest.update(f"{name}={fingerprints[name]}".encode())
+            return digest.hexdigest()
+
+        def resolve(name):
+            value = artifacts[name]
+            return value.resolve() if isinstance(value, LazyArtifact) else value
+
+        def execute(stage, stage_fingerprint, skip):
+            start = time.perf_counter()
+            if skip:
+                inputs = {i: artifacts[i] for i in stage.inputs}
+                if stage.load is None:
+                    outputs = {o: None for o in stage.outputs}
+                else:
+                    loaded = LazyArtifact(lambda: stage.load(
+                        **{k: v.resolve() if isinstance(v, LazyArtifact) else v for k, v in inputs.items()}
+                    ))
+                    outputs = {o: LazyArtifact(lambda o=o: loaded.resolve()[o]) for o in stage.outputs}
+            else:
+                with span(f'stage.{stage.name}'):
+                    outputs = stage.func(**{i: resolve(i) for i in stage.inputs})
+            return outputs or {}, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dependencies = self._dependencies(stage)
+                    if any(results.get(d) in ('failed', 'blocked') for d in dependencies):
+                        results[name] = 'blocked'
+                        del pending[name]
+                        print(f"Blocked: {name} (an upstream stage failed)")
+                        continue
+                    if not all(results.get(d) in ('ran', 'skipped') for d in dependencies):
+                        continue
+                    stage_fingerprint = input_fingerprint(stage)
+                    previous = state.get(name, {})
+                    skip = (not stage.always_run and name not in force
+                            and previous.get('inputs') == stage_fingerprint
+                            and all(o in previous.get('outputs', {}) for o in stage.outputs))
+                    print(f"{'Skipping' if skip else 'Running'}: {name}")
+                    running[pool.submit(execute, stage, stage_fingerprint, skip)] = (stage, stage_fingerprint, skip)
+                    del pending[name]
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, stage_fingerprint, skip = running.pop(future)
+                    try:
+                        outputs, elapsed = future.result()
+                        missing = [o for o in stage.outputs if o not in outputs]
+                        if missing:
+                            raise RuntimeError(f"did not produce {missing}")
+                    except Exception as e:
+                        results[stage.name] = 'failed'
+                        print(f"Error in {stage.name}: {e}")
+                        continue
+
+                    timings[stage.name] = elapsed
+                    for output in stage.outputs:
+                        artifacts[output] = outputs[output]
+                        if skip:
+                            fingerprints[output] = state[stage.name]['outputs'][output]
+                        elif _is_paths(outputs[output]):
+                            fingerprints[output] = file_fingerprint(outputs[output])
+                        else:
+                            fingerprints[output] = hashlib.sha256(
+                                f"{stage_fingerprint}:{output}".encode()).hexdigest()
+                    if skip:
+                        results[stage.name] = 'skipped'
+                    else:
+                        results[stage.name] = 'ran'
+                        state[stage.name] = {
+                            'inputs': stage_fingerprint,
+                            'outputs': {o: fingerprints[o] for o in stage.outputs},
+                        }
+                        self._save_state(state)
+                    print(f"{results[stage.name].capitalize()}: {stage.name} ({elapsed:.2f}s)")
+
+        self.timings = timings
+        return results
@@ -0,0 +1,197 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from covid_storage import load_combined
+from covid_tracing import file_size, span
+
+POWERBI_DIR = 'powerbi'
+
+FACT_CSV = 'covid19_powerbi_ready.csv'
+FACT_PARQUET_DIR = 'fact_covid19'
+DIM_LOCATION = 'dim_location'
+DIM_DATE = 'dim_date'
+
+LOCATION_KEY = ['Country/Region', 'Province/State']
+
+FACT_COUNTS = ['Confirmed', 'Deaths', 'Recovered', 'Active', 'New_Confirmed', 'New_Deaths', 'New_Recovered']
+FACT_RATES = ['Mortality_Rate', 'Recovery_Rate']
+FACT_MEASURES = FACT_COUNTS + FACT_RATES
+
+def _read_dimension(output_dir, name):
+    path = os.path.join(output_dir, f'{name}.csv')
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, keep_default_na=False, na_values={'Lat': [''], 'Long': ['']})
+
+def _location_keys(df, dim_location):
+    """Map each row to a LocationKey, adding unseen locations to the dimension
+
+    Existing keys never change, so fact rows written by earlier runs stay valid.
+    Locations are identified by country and province; a blank province is ''.
+    """
+    keys = df[['Country/Region', 'Province/State', 'Lat', 'Long']].copy()
+    keys['Province/State'] = keys['Province/State'].astype(object).where(keys['Province/State'].notna(), '')
+    if dim_location is None:
+        dim_location = pd.DataFrame({'LocationKey': pd.Series(dtype='int32'),
+                                     'Country/Region': pd.Series(dtype=object),
+                                     'Province/State': pd.Series(dtype=object),
+                                     'Lat': pd.Series(dtype='float64'),
+                                     'Long': pd.Series(dtype='float64')})
+    known = pd.MultiIndex.from_frame(dim_location[LOCATION_KEY].astype(str))
+    row_keys = pd.MultiIndex.from_frame(keys[LOCATION_KEY].astype(str))
+    positions = known.get_indexer(row_keys)
+
+    unseen = keys[positions < 0].drop_duplicates(LOCATION_KEY)
+    if len(unseen):
+        first_key = int(dim_location['LocationKey'].max()) + 1 if len(dim_location) else 1
+        unseen.insert(0, 'LocationKey', np.arange(first_key, first_key + len(unseen), dtype='int32'))
+        dim_location = pd.concat([dim_location, unseen], ignore_index=True)
+        known = pd.MultiIndex.from_frame(dim_location[LOCATION_KEY].astype(str))
+        positions = known.get_indexer(row_keys)
+    return dim_location['LocationKey'].to_numpy()[positions].astype('int32'), dim_location, len(unseen)
+
+def _date_dimension(dates):
+    dates = pd.DatetimeIndex(dates)
+    return pd.DataFrame({
+        'DateKey': (dates.year * 10000 + dates.month * 100 + dates.day).astype('int32'),
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Year': dates.year.astype('int16'),
+        'Quarter': dates.quarter.astype('int8'),
+        'Month': dates.month.astype('int8'),
+        'MonthName': dates.month_name(),
+        'Day': dates.day.astype('int8'),
+        'DayOfWeek': dates.day_name(),
+        'WeekdayNumber': (dates.dayofweek + 1).astype('int8'),
+    })
+
+def _write_dimension(frame, output_dir, name, columnar):
+    paths = [os.path.join(output_dir, f'{name}.csv')]
+    frame.to_csv(paths[0], index=False)
+    if columnar:
+        paths.append(os.path.join(output_dir, f'{name}.parquet'))
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), paths[1], compression='snappy')
+    return paths
+
+def _clear_export(output_dir):
+    for name in (FACT_CSV, f'{DIM_LOCATION}.csv', f'{DIM_LOCATION}.parquet',
+                 f'{DIM_DATE}.csv', f'{DIM_DATE}.parquet'):
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(os.path.join(output_dir, FACT_PARQUET_DIR), ignore_errors=True)
+
+def export_powerbi(df=None, output_dir=POWERBI_DIR, columnar=False, full=False):
+    """Write the combined dataset as a star schema for Power BI, appending only new dates
+
+    The fact table (covid19_powerbi_ready.csv) holds integer DateKey (YYYYMMDD)
+    and LocationKey columns plus the measures; dim_location and dim_date hold
+    the strings once per location and per date. Later runs append fact rows for
+    dates after the last exported one and extend the dimensions. With
+    columnar=True the fact rows are also written as snappy Parquet files under
+    fact_covid19/ (one per run) and the dimensions as Parquet. full=True
+    discards the previous export first, e.g. after historical revisions; the
+    export is also rewritten when its dates are no longer a prefix of df's,
+    i.e. the combined dataset was rebuilt from other data. Without df the
+    stored combined dataset is used, reading only its Date column and the rows
+    for the dates to append.
+    Returns a dict with row counts and output sizes.
+    """
+    with span('powerbi.export') as trace:
+        if full and os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        fact_path = os.path.join(output_dir, FACT_CSV)
+
+        dates = pd.to_datetime((load_combined(columns=['Date']) if df is None else df)['Date'])
+        trace.rows_in = len(dates)
+        dim_date = _read_dimension(output_dir, DIM_DATE)
+        dim_location = _read_dimension(output_dir, DIM_LOCATION)
+        if dim_date is None or dim_location is None or not os.path.exists(fact_path):
+            # Keys in a partial export cannot be trusted; start over
+            dim_date, dim_location = None, None
+            _clear_export(output_dir)
+        elif len(dim_date):
+            exported = pd.DatetimeIndex(pd.to_datetime(dim_date['Date'])).sort_values()
+            incoming = pd.DatetimeIndex(dates.unique()).sort_values()
+            if not exported.equals(incoming[incoming <= exported[-1]]):
+                print("Power BI export: combined dataset no longer matches the export, rewriting it")
+                dim_date, dim_location = None, None
+                _clear_export(output_dir)
+
+        last_exported = None
+        if dim_date is not None and len(dim_date):
+            last_exported = pd.Timestamp(dim_date['Date'].max())
+            print(f"Power BI export: appending dates after {last_exported:%Y-%m-%d}")
+        if df is None:
+            start = None if last_exported is None else last_exported + pd.Timedelta(days=1)
+            new_rows = load_combined(start=start)
+            row_dates = pd.to_datetime(new_rows['Date'])
+        else:
+            is_new = np.ones(len(df), dtype=bool) if last_exported is None else (dates > last_exported).to_numpy()
+            new_rows = df[is_new]
+            row_dates = dates[is_new]
+        stats = {'rows_appended': len(new_rows), 'new_locations': 0, 'new_dates': 0}
+        if new_rows.empty:
+            print("Power BI export already up to date")
+            trace.rows_out = 0
+            return stats
+
+        new_dates = pd.DatetimeIndex(row_dates.unique()).sort_values()
+        location_keys, dim_location, stats['new_locations'] = _location_keys(new_rows, dim_location)
+        new_date_rows = _date_dimension(new_dates)
+        dim_date = new_date_rows if dim_date is None else pd.concat([dim_date, new_date_rows], ignore_index=True)
+        stats['new_dates'] = len(new_dates)
+
+        fact = pd.DataFrame({
+            'DateKey': (row_dates.dt.year * 10000 + row_dates.dt.month * 100 + row_dates.dt.day)
+                       .to_numpy(dtype='int32'),
+            'LocationKey': location_keys,
+        })
+        for column in FACT_MEASURES:
+            if column not in new_rows.columns:
+                continue
+            if column in FACT_COUNTS:
+                # Counts are whole numbers; keep them integers in the CSV and Parquet
+                fact[column] = new_rows[column].fillna(0).to_numpy().round().astype('int64')
+            else:
+                fact[column] = new_rows[column].round(4).to_numpy()
+        fact = fact.sort_values(['DateKey', 'LocationKey'], kind='stable')
+
+        fact.to_csv(fact_path, mode='a', header=not os.path.exists(fact_path), index=False)
+        written = [fact_path]
+        written += _write_dimension(dim_location, output_dir, DIM_LOCATION, columnar)
+        written += _write_dimension(dim_date, output_dir, DIM_DATE, columnar)
+        if columnar:
+            parquet_dir = os.path.join(output_dir, FACT_PARQUET_DIR)
+            os.makedirs(parquet_dir, exist_ok=True)
+            parquet_path = os.path.join(
+                parquet_dir, f"part-{new_dates[0]:%Y%m%d}-{new_dates[-1]:%Y%m%d}.parquet")
+            pq.write_table(pa.Table.from_pandas(fact, preserve_index=False), parquet_path,
+                           compression='snappy')
+            written.append(parquet_path)
+
+        stats['fact_bytes'] = file_size(fact_path)
+        trace.rows_out = len(fact)
+        trace.bytes_written = sum(file_size(path) or 0 for path in written)
+
+    print(f"Power BI export: {len(fact):,} fact rows for {len(new_dates)} date(s), "
+          f"{stats['new_locations']} new location(s) -> {output_dir}/")
+    print(f"  {FACT_CSV}: {stats['fact_bytes']:,} bytes; dimensions: {len(dim_location)} locations, "
+          f"{len(dim_date)} dates")
+    return stats
+
+def powerbi_files(output_dir=POWERBI_DIR):
+    """Paths of every exported file, for fingerprinting"""
+    paths = []
+    for directory, _, names in os.walk(output_dir):
+        paths.extend(os.path.join(directory, name) for name in names)
+    return sorted(paths)
+
+if __name__ == "__main__":
+    import sys
+
+    export_powerbi(columnar='--columnar' in sys.argv, full='--full' in sys.argv)
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import bisect
+import json
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import text
+
+from covid_sql import (DATABASE_URL, create_covid_engine, global_totals, highest_mortality, monthly_trends,
+                       top_countries)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8050
+
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is open
+LATENCY_BUCKETS_MS = [0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500]
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+def _rows(result):
+    return [dict(row._mapping) for row in result]
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+def _top(conn, params):
+    return _rows(top_countries(conn, params.get('metric', 'Confirmed'), _int_param(params, 'n', 10)))
+
+def _totals(conn, params):
+    row = global_totals(conn, params.get('date'))
+    return dict(row._mapping) if row is not None else None
+
+def _monthly(conn, params):
+    return _rows(monthly_trends(conn, _int_param(params, 'months', 12)))
+
+def _mortality(conn, params):
+    return _rows(highest_mortality(conn, _int_param(params, 'n', 5), _int_param(params, 'min_confirmed', 1000)))
+
+# Path -> function(conn, query params) returning a JSON-serialisable result
+ENDPOINTS = {
+    '/top': _top,
+    '/totals': _totals,
+    '/monthly': _monthly,
+    '/mortality': _mortality,
+}
+
+class LatencyHistogram:
+    """Request latencies counted into fixed millisecond buckets"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total_ms = 0.0
+        self.count = 0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total_ms += ms
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None past the last bound)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + [None], self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p99_ms': self.quantile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+class ResultCache:
+    """LRU cache of endpoint results tagged with the data version they were computed at
+
+    Entries from an older version are treated as misses, so nothing has to be
+    cleared when new dates arrive.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, body):
+        self.entries[key] = (version, body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class CovidService:
+    """Answer the covid_sql example queries as JSON over HTTP
+
+    Queries run on a thread pool sized to the engine's connection pool, so each
+    worker holds one pooled SQLite connection. Results are cached per path and
+    query string; the data version (the last ingest_log and global_daily
+    writes) is re-read at most every version_interval seconds, and any change to
+    it invalidates every cached result.
+    """
+
+    def __init__(self, url=DATABASE_URL, pool_size=4, cache_size=256, version_interval=1.0):
+        self.engine = create_covid_engine(url, pool_size=pool_size, max_overflow=0)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='covid-sql')
+        self.cache = ResultCache(cache_size)
+        self.histograms = {}
+        self.version_interval = version_interval
+        self._version = None
+        self._version_checked = 0.0
+        self._version_lock = asyncio.Lock()
+
+    def _read_version(self):
+        # Both tables are written with INSERT OR REPLACE, which gives every new or
+        # revised date a fresh rowid, so MAX(rowid) moves on every ingest that
+        # changes data and again once the rollups for it are refreshed
+        with self.engine.connect() as conn:
+            return tuple(conn.execute(text("""
+                SELECT (SELECT MAX(rowid) FROM ingest_log),
+                       (SELECT MAX(Date) FROM ingest_log),
+                       (SELECT MAX(rowid) FROM global_daily)
+            """)).first())
+
+    def _query(self, path, params):
+        with self.engine.connect() as conn:
+            return json.dumps(ENDPOINTS[path](conn, params), default=str).encode()
+
+    async def data_version(self):
+        async with self._version_lock:
+            now = time.monotonic()
+            if self._version is None or now - self._version_checked >= self.version_interval:
+                loop = asyncio.get_running_loop()
+                self._version = await loop.run_in_executor(self.executor, self._read_version)
+                self._version_checked = now
+            return self._version
+
+    def stats(self):
+        return {
+            'cache': {'entries': len(self.cache.entries), 'hits': self.cache.hits, 'misses': self.cache.misses},
+            'latency': {path: histogram.snapshot() for path, histogram in sorted(self.histograms.items())},
+            'version': self._version,
+        }
+
+    async def respond(self, method, target):
+        """Return (status, JSON body bytes) for one request"""
+        if method != 'GET':
+            return 405, b'{"error": "only GET is supported"}'
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return 200, json.dumps(self.stats()).encode()
+        if url.path == '/health':
+            return 200, b'{"status": "ok"}'
+        if url.path not in ENDPOINTS:
+            return 404, json.dumps({'error': f"unknown path {url.path}", 'paths': sorted(ENDPOINTS)}).encode()
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        key = (url.path, tuple(sorted(params.items())))
+        version = await self.data_version()
+        body = self.cache.get(key, version)
+        if body is None:
+            loop = asyncio.get_running_loop()
+            try:
+                body = await loop.run_in_executor(self.executor, self._query, url.path, params)
+            except ValueError as e:
+                return 400, json.dumps({'error': str(e)}).encode()
+            self.cache.put(key, version, body)
+        return 200, body
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, _ = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, body, target = 400, b'{"error": "malformed request line"}', ''
+                else:
+                    try:
+                        status, body = await self.respond(method, target)
+                    except Exception as e:
+                        status, body = 500, json.dumps({'error': f"{type(e).__name__}: {e}"}).encode()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                path = urlsplit(target).path if status != 404 else '<unknown>'
+                self.histograms.setdefault(path, LatencyHistogram()).observe(
+                    (time.perf_counter() - start) * 1000)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving COVID-19 queries on http://{host}:{port} ({', '.join(sorted(ENDPOINTS))}, /stats)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+            self.engine.dispose()
+
+async def _client(host, port, paths, offset, count, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(count):
+            path = paths[(offset + i) % len(paths)]
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append((path, status))
+    finally:
+        writer.close()
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def load_test(host=DEFAULT_HOST, port=DEFAULT_PORT, requests=2000, concurrency=20, paths=None):
+    """Send requests over concurrency keep-alive connections and return latency statistics
+
+    Paths are cycled so every endpoint is exercised; latencies are measured
+    client-side per request, from send to the end of the response body.
+    """
+    paths = paths or ['/top?metric=Confirmed&n=10', '/totals', '/monthly?months=12', '/mortality?n=5']
+    latencies, errors = [], []
+    per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, paths, i, count, latencies, errors)
+        for i, count in enumerate(per_client) if count
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(_percentile(latencies, 0.50), 3) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99), 3) if latencies else None,
+        'max_ms': round(latencies[-1], 3) if latencies else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local JSON query service over the COVID-19 SQLite database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the HTTP service")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--database', default=DATABASE_URL, help=f"SQLAlchemy URL (default: {DATABASE_URL})")
+    serve_parser.add_argument('--pool-size', type=int, default=4, help="Pooled SQLite connections (default: 4)")
+    serve_parser.add_argument('--cache-size', type=int, default=256, help="Cached results (default: 256)")
+
+    load_parser = commands.add_parser('loadtest', help="Load-test a running service and report p50/p99")
+    load_parser.add_argument('--host', default=DEFAULT_HOST)
+    load_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    load_parser.add_argument('--requests', type=int, default=2000)
+    load_parser.add_argument('--concurrency', type=int, default=20)
+    load_parser.add_argument('--path', action='append', dest='paths', help="Path to request (repeatable)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        service = CovidService(args.database, pool_size=args.pool_size, cache_size=args.cache_size)
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    result = asyncio.run(load_test(args.host, args.port, args.requests, args.concurrency, args.paths))
+    print(f"{result['requests']:,} requests in {result['seconds']}s ({result['requests_per_second']} req/s), "
+          f"{result['errors']} errors")
+    print(f"  p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  max {result['max_ms']} ms")
+    return 1 if result['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
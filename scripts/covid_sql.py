@@ -1,18 +1,441 @@
+import time
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 
-def setup_covid_database():
-    """Create SQLite database and tables for COVID-19 data"""
+from covid_cube import open_current_cube
+from covid_metrics import CountryMatrix, compute_forecast, compute_metrics
+from covid_storage import load_combined
+from covid_tracing import file_size, span, traced
+
+DATABASE_URL = 'sqlite:///data/covid19_database.db'
+
+TABLE_NAME = 'covid19_global'
+
+# Column name -> SQLite type, in combined dataset order
+TABLE_COLUMNS = {
+    'Province/State': 'TEXT NOT NULL',
+    'Country/Region': 'TEXT NOT NULL',
+    'Lat': 'REAL',
+    'Long': 'REAL',
+    'Date': 'TEXT NOT NULL',
+    'Confirmed': 'INTEGER NOT NULL',
+    'Deaths': 'INTEGER NOT NULL',
+    'Recovered': 'INTEGER NOT NULL',
+    'Active': 'INTEGER NOT NULL',
+    'New_Confirmed': 'INTEGER NOT NULL',
+    'New_Deaths': 'INTEGER NOT NULL',
+    'New_Recovered': 'INTEGER NOT NULL',
+    'Mortality_Rate': 'REAL',
+    'Recovery_Rate': 'REAL',
+    'Year': 'INTEGER',
+    'Month': 'INTEGER',
+    'DayOfWeek': 'TEXT',
+}
+
+KEY_COLUMNS = ['Country/Region', 'Province/State', 'Date']
+
+INTEGER_COLUMNS = [c for c, t in TABLE_COLUMNS.items() if t.startswith('INTEGER')]
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def create_covid_engine(url=DATABASE_URL, **engine_options):
+    """Create a SQLite engine with ingest-friendly pragmas set on every connection
+
+    engine_options are passed to create_engine, e.g. pool_size for the query service.
+    """
+    engine = create_engine(url, **engine_options)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+    return engine
+
+def create_schema(conn):
+    """Create the typed covid19_global table, its indexes and the ingest log
+
+    A table left over from the old to_sql load (no primary key) is replaced.
+    """
+    primary_key = [row[1] for row in conn.execute(text(f"PRAGMA table_info({TABLE_NAME})")) if row[5]]
+    if not primary_key and conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': TABLE_NAME}).first():
+        conn.execute(text(f"DROP TABLE {TABLE_NAME}"))
+        conn.execute(text("DROP TABLE IF EXISTS ingest_log"))
+
+    columns = ",\n".join(f"    {_quote(c)} {t}" for c, t in TABLE_COLUMNS.items())
+    key = ", ".join(_quote(c) for c in KEY_COLUMNS)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} (\n{columns},\n    PRIMARY KEY ({key})\n)"))
+    # The primary key already serves lookups by country; add one led by Date
+    # for the latest-snapshot queries
+    conn.execute(text(
+        f'CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_date ON {TABLE_NAME} (Date, "Country/Region")'
+    ))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS ingest_log (
+            Date TEXT PRIMARY KEY,
+            Rows INTEGER NOT NULL,
+            Checksum TEXT NOT NULL
+        )
+    """))
+
+def _prepare_rows(df):
+    """Convert the combined frame to the table layout (ISO date strings, '' for no province)"""
+    rows = pd.DataFrame(index=df.index)
+    for column in TABLE_COLUMNS:
+        rows[column] = df[column] if column in df.columns else None
+    rows['Province/State'] = rows['Province/State'].astype(object).where(rows['Province/State'].notna(), '')
+    # Format each distinct date once instead of once per row
+    codes, uniques = pd.factorize(pd.to_datetime(df['Date']))
+    rows['Date'] = pd.Index(uniques.strftime('%Y-%m-%d'))[codes]
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            rows[column] = rows[column].fillna(0).astype('int64')
+    return rows
+
+def _date_checksums(rows):
+    """Return row count and an order-independent content hash for every date"""
+    hashes = pd.util.hash_pandas_object(rows.astype({'Province/State': str}), index=False)
+    summary = pd.DataFrame({'Date': rows['Date'].to_numpy(), 'Hash': hashes.to_numpy()})
+    grouped = summary.groupby('Date')['Hash']
+    return pd.DataFrame({
+        'Rows': grouped.size(),
+        'Checksum': grouped.sum().map(lambda h: format(int(h), '016x')),
+    })
+
+def ingest_covid_data(engine, df, chunk_size=50000):
+    """Upsert the combined dataset into covid19_global, touching only new or changed dates
+
+    Each date's rows are hashed and compared against ingest_log; dates whose hash
+    matches are skipped. The rest are upserted in chunked transactions. Returns
+    a dict with row counts, elapsed time and rows/s.
+    """
+    database = engine.url.database
+    with span('sql.ingest', rows_in=len(df)) as trace:
+        size_before = file_size(database) or 0
+        stats = _upsert_changed_dates(engine, df, chunk_size)
+        trace.rows_out = stats['rows_written']
+        trace.bytes_written = max((file_size(database) or 0) - size_before, 0)
+    return stats
+
+def _upsert_changed_dates(engine, df, chunk_size):
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        create_schema(conn)
+        stored = pd.read_sql(text("SELECT Date, Rows, Checksum FROM ingest_log"), conn).set_index('Date')
+
+    rows = _prepare_rows(df)
+    checksums = _date_checksums(rows)
+    unchanged = checksums.join(stored, rsuffix='_stored', how='inner')
+    unchanged = unchanged[(unchanged['Checksum'] == unchanged['Checksum_stored'])
+                          & (unchanged['Rows'] == unchanged['Rows_stored'])].index
+    pending = checksums.index.difference(unchanged)
+    # Dates no longer in the incoming frame, e.g. after the store was rebuilt
+    removed = stored.index.difference(checksums.index)
+    rows = rows[rows['Date'].isin(pending)]
+
+    # Clear removed and changed dates first so locations missing from the new
+    # rows do not survive; their log entries go too, so an interrupted load is
+    # retried on the next run
+    cleared = [(date,) for date in removed.union(stored.index.intersection(pending))]
+    if cleared:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {TABLE_NAME} WHERE Date = ?", cleared)
+            conn.exec_driver_sql("DELETE FROM ingest_log WHERE Date = ?", cleared)
+
+    names = ", ".join(_quote(c) for c in TABLE_COLUMNS)
+    placeholders = ", ".join("?" for _ in TABLE_COLUMNS)
+    updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in TABLE_COLUMNS if c not in KEY_COLUMNS)
+    upsert = (f"INSERT INTO {TABLE_NAME} ({names}) VALUES ({placeholders}) "
+              f"ON CONFLICT ({', '.join(_quote(c) for c in KEY_COLUMNS)}) DO UPDATE SET {updates}")
+
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows.iloc[offset:offset + chunk_size]
+        # tolist() yields native Python values, which sqlite3 binds directly
+        values = list(zip(*(chunk[c].tolist() for c in TABLE_COLUMNS)))
+        with engine.begin() as conn:
+            conn.exec_driver_sql(upsert, values)
+
+    log = checksums.loc[pending].reset_index()
+    if len(log):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT OR REPLACE INTO ingest_log (Date, Rows, Checksum) VALUES (?, ?, ?)",
+                list(zip(log['Date'].tolist(), log['Rows'].astype(int).tolist(), log['Checksum'].tolist())),
+            )
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'rows_total': len(df),
+        'rows_written': len(rows),
+        'dates_written': len(pending),
+        'dates_skipped': len(unchanged),
+        'dates': list(pending),
+        'dates_removed': list(removed),
+        'seconds': elapsed,
+        'rows_per_second': len(rows) / elapsed if elapsed > 0 else 0.0,
+    }
+    mode = 'Incremental' if len(unchanged) else 'Full'
+    print(f"{mode} load: {stats['rows_written']:,} rows across {stats['dates_written']} dates "
+          f"in {elapsed:.2f}s ({stats['rows_per_second']:,.0f} rows/s, {stats['dates_skipped']} dates unchanged)")
+    if len(removed):
+        print(f"  Removed {len(removed)} dates no longer in the combined dataset")
+    return stats
+
+SUMMARY_TABLES = {
+    'global_daily': """
+        CREATE TABLE IF NOT EXISTS global_daily (
+            Date TEXT PRIMARY KEY,
+            Confirmed INTEGER NOT NULL,
+            Deaths INTEGER NOT NULL,
+            Recovered INTEGER NOT NULL,
+            Active INTEGER NOT NULL,
+            New_Confirmed INTEGER NOT NULL,
+            New_Deaths INTEGER NOT NULL,
+            New_Recovered INTEGER NOT NULL
+        )
+    """,
+    'country_monthly': """
+        CREATE TABLE IF NOT EXISTS country_monthly (
+            "Country/Region" TEXT NOT NULL,
+            YearMonth TEXT NOT NULL,
+            New_Confirmed INTEGER NOT NULL,
+            New_Deaths INTEGER NOT NULL,
+            New_Recovered INTEGER NOT NULL,
+            PRIMARY KEY (YearMonth, "Country/Region")
+        )
+    """,
+    'latest_by_country': """
+        CREATE TABLE IF NOT EXISTS latest_by_country (
+            "Country/Region" TEXT PRIMARY KEY,
+            Date TEXT NOT NULL,
+            Confirmed INTEGER NOT NULL,
+            Deaths INTEGER NOT NULL,
+            Recovered INTEGER NOT NULL,
+            Active INTEGER NOT NULL,
+            Mortality_Rate REAL NOT NULL,
+            Recovery_Rate REAL NOT NULL
+        )
+    """,
+}
+
+def create_summary_tables(conn):
+    """Create the materialized rollup tables if they do not exist"""
+    for ddl in SUMMARY_TABLES.values():
+        conn.execute(text(ddl))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_latest_by_country_confirmed ON latest_by_country (Confirmed DESC)"
+    ))
+
+@traced('sql.rollups')
+def refresh_summary_tables(engine, dates=None):
+    """Recompute the rollups touched by the given ISO dates (all dates if None)
+
+    global_daily is rebuilt for those dates, country_monthly for the months they
+    fall in, and latest_by_country whenever one of them is the newest date or
+    the newest date has changed. Dates that no longer have rows in covid19_global
+    are dropped from the rollups. Every source query is an index range on Date.
+    """
+    with engine.begin() as conn:
+        create_summary_tables(conn)
+        if dates is None:
+            dates = [row[0] for row in conn.execute(text(f"SELECT DISTINCT Date FROM {TABLE_NAME}"))]
+        dates = sorted(set(dates))
+        if not dates:
+            return
+
+        for date in dates:
+            conn.execute(text("DELETE FROM global_daily WHERE Date = :date"), {'date': date})
+            conn.execute(text(f"""
+                INSERT INTO global_daily
+                SELECT Date, SUM(Confirmed), SUM(Deaths), SUM(Recovered), SUM(Active),
+                       SUM(New_Confirmed), SUM(New_Deaths), SUM(New_Recovered)
+                FROM {TABLE_NAME}
+                WHERE Date = :date
+                GROUP BY Date
+            """), {'date': date})
+
+        for month in sorted({date[:7] for date in dates}):
+            params = {'month': month, 'start': month + '-01', 'end': month + '-32'}
+            conn.execute(text("DELETE FROM country_monthly WHERE YearMonth = :month"), params)
+            conn.execute(text(f"""
+                INSERT INTO country_monthly
+                SELECT "Country/Region", :month, SUM(New_Confirmed), SUM(New_Deaths), SUM(New_Recovered)
+                FROM {TABLE_NAME}
+                WHERE Date >= :start AND Date < :end
+                GROUP BY "Country/Region"
+            """), params)
+
+        latest = conn.execute(text(f"SELECT MAX(Date) FROM {TABLE_NAME}")).scalar()
+        shown = conn.execute(text("SELECT MAX(Date) FROM latest_by_country")).scalar()
+        if latest in dates or latest != shown:
+            conn.execute(text("DELETE FROM latest_by_country"))
+            conn.execute(text(f"""
+                INSERT INTO latest_by_country
+                SELECT "Country/Region", Date,
+                       SUM(Confirmed), SUM(Deaths), SUM(Recovered), SUM(Active),
+                       COALESCE(SUM(Deaths) * 100.0 / NULLIF(SUM(Confirmed), 0), 0),
+                       COALESCE(SUM(Recovered) * 100.0 / NULLIF(SUM(Confirmed), 0), 0)
+                FROM {TABLE_NAME}
+                WHERE Date = :date
+                GROUP BY "Country/Region"
+            """), {'date': latest})
+
+def _iso_dates(values):
+    codes, uniques = pd.factorize(pd.to_datetime(values))
+    return pd.Index(uniques.strftime('%Y-%m-%d'))[codes]
+
+@traced('sql.metrics')
+def refresh_metrics_tables(engine, df, since=None, horizon=14, cube=None):
+    """Store rolling/growth metrics (country_metrics) and forecasts (country_forecast)
+
+    Metrics are computed for all countries at once with covid_metrics. Only rows
+    dated on or after since (an ISO date) are replaced, since a new day only
+    changes the trailing windows from that day on; rows for countries no longer
+    in df are dropped. country_forecast is replaced.
+    The country matrices are read from cube (a CovidCube of df) when given.
+    """
+    matrix = CountryMatrix.from_cube(cube) if cube is not None else CountryMatrix(df)
+    metrics = compute_metrics(matrix)
+    forecasts = compute_forecast(matrix, horizon=horizon)
+    metrics['Date'] = _iso_dates(metrics['Date'])
+    forecasts['Date'] = _iso_dates(forecasts['Date'])
+    if since is not None:
+        metrics = metrics[metrics['Date'] >= since]
+
+    value_columns = [c for c in metrics.columns if c not in ('Country/Region', 'Date')]
+    with engine.begin() as conn:
+        columns = ",\n".join(f"    {_quote(c)} REAL" for c in value_columns)
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS country_metrics (
+                "Country/Region" TEXT NOT NULL,
+                Date TEXT NOT NULL,
+            {columns},
+                PRIMARY KEY (Date, "Country/Region")
+            )
+        """))
+        if since is None:
+            conn.execute(text("DELETE FROM country_metrics"))
+        else:
+            conn.execute(text("DELETE FROM country_metrics WHERE Date >= :since"), {'since': since})
+            stored = [row[0] for row in conn.execute(text(
+                'SELECT DISTINCT "Country/Region" FROM country_metrics'))]
+            gone = sorted(set(stored) - set(matrix.locations))
+            if gone:
+                conn.exec_driver_sql('DELETE FROM country_metrics WHERE "Country/Region" = ?',
+                                     [(country,) for country in gone])
+        names = ", ".join(_quote(c) for c in metrics.columns)
+        placeholders = ", ".join("?" for _ in metrics.columns)
+        # NaN (window not yet filled) is stored as NULL
+        values = metrics.astype(object).where(metrics.notna(), None)
+        conn.exec_driver_sql(
+            f"INSERT OR REPLACE INTO country_metrics ({names}) VALUES ({placeholders})",
+            list(values.itertuples(index=False, name=None)),
+        )
+
+        conn.execute(text("DROP TABLE IF EXISTS country_forecast"))
+        conn.execute(text("""
+            CREATE TABLE country_forecast (
+                "Country/Region" TEXT NOT NULL,
+                Date TEXT NOT NULL,
+                Forecast_Confirmed REAL NOT NULL,
+                Method TEXT NOT NULL,
+                PRIMARY KEY (Date, "Country/Region")
+            )
+        """))
+        conn.exec_driver_sql(
+            "INSERT INTO country_forecast VALUES (?, ?, ?, ?)",
+            list(forecasts.astype(object).itertuples(index=False, name=None)),
+        )
+    return len(metrics)
+
+def top_countries(conn, metric='Confirmed', n=10):
+    """Return (country, value) pairs for the n countries with the highest latest metric"""
+    if metric not in ('Confirmed', 'Deaths', 'Recovered', 'Active'):
+        raise ValueError(f"Unknown metric: {metric}")
+    return conn.execute(text(f"""
+        SELECT "Country/Region", {metric}
+        FROM latest_by_country
+        ORDER BY {metric} DESC
+        LIMIT :n
+    """), {'n': n}).fetchall()
+
+def global_totals(conn, date=None):
+    """Return global Confirmed/Deaths/Recovered/Active for a date (latest if None)"""
+    if date is None:
+        return conn.execute(text("""
+            SELECT Confirmed, Deaths, Recovered, Active
+            FROM global_daily
+            ORDER BY Date DESC
+            LIMIT 1
+        """)).first()
+    return conn.execute(text("""
+        SELECT Confirmed, Deaths, Recovered, Active FROM global_daily WHERE Date = :date
+    """), {'date': date}).first()
+
+def monthly_trends(conn, months=12):
+    """Return (YearMonth, new cases, new deaths, new recovered) for the last months, oldest first"""
+    rows = conn.execute(text("""
+        SELECT YearMonth, SUM(New_Confirmed), SUM(New_Deaths), SUM(New_Recovered)
+        FROM country_monthly
+        GROUP BY YearMonth
+        ORDER BY YearMonth DESC
+        LIMIT :months
+    """), {'months': months}).fetchall()
+    return rows[::-1]
+
+def highest_mortality(conn, n=5, min_confirmed=1000):
+    """Return (country, confirmed, deaths, mortality %) for the highest latest mortality rates
+
+    Countries are filtered on their total confirmed cases rather than per row.
+    """
+    return conn.execute(text("""
+        SELECT "Country/Region", Confirmed, Deaths, ROUND(Mortality_Rate, 2)
+        FROM latest_by_country
+        WHERE Confirmed > :min_confirmed
+        ORDER BY Mortality_Rate DESC
+        LIMIT :n
+    """), {'n': n, 'min_confirmed': min_confirmed}).fetchall()
+
+@traced('sql')
+def setup_covid_database(df=None, cube=None):
+    """Create SQLite database and tables for COVID-19 data
+
+    cube, a CovidCube of df, feeds the metrics tables; when df is loaded here,
+    the stored cube is used if it is current.
+    """
     
     try:
         # Create SQLite engine
-        engine = create_engine('sqlite:///data/covid19_database.db')
+        engine = create_covid_engine()
         
         # Load combined data
-        df = pd.read_csv("data/covid19_combined_global.csv")
+        if df is None:
+            df = load_combined()
+            cube = cube or open_current_cube()
         
-        # Save to SQL database
-        df.to_sql('covid19_global', engine, if_exists='replace', index=False)
+        # Upsert new or changed dates into the indexed table, then refresh rollups
+        stats = ingest_covid_data(engine, df)
+        with engine.connect() as conn:
+            create_summary_tables(conn)
+            conn.commit()
+            missing_rollups = conn.execute(text("SELECT COUNT(*) FROM global_daily")).scalar() == 0
+            missing_metrics = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'country_metrics'")).first() is None
+        touched = stats['dates'] + stats['dates_removed']
+        refresh_summary_tables(engine, None if missing_rollups else touched)
+        if touched or missing_metrics:
+            refresh_metrics_tables(engine, df, since=None if missing_metrics else min(touched), cube=cube)
         
         print("Data successfully loaded into SQL database")
         
@@ -25,73 +448,35 @@ def setup_covid_database():
             columns = [row[1] for row in result]
             print("Available columns:", columns)
             
-            # Top 10 countries by confirmed cases - FIXED COLUMN NAME
-            result = conn.execute(text("""
-                SELECT "Country/Region", SUM(Confirmed) as TotalConfirmed
-                FROM covid19_global
-                WHERE Date = (SELECT MAX(Date) FROM covid19_global)
-                GROUP BY "Country/Region"
-                ORDER BY TotalConfirmed DESC
-                LIMIT 10
-            """))
+            # Top 10 countries by confirmed cases
             print("Top 10 Countries by Confirmed Cases:")
-            for row in result:
+            for row in top_countries(conn, 'Confirmed', 10):
                 print(f"  {row[0]}: {row[1]:,} cases")
             
             # Global totals
-            result = conn.execute(text("""
-                SELECT 
-                    SUM(Confirmed) as TotalConfirmed,
-                    SUM(Deaths) as TotalDeaths,
-                    SUM(Recovered) as TotalRecovered,
-                    SUM(Active) as TotalActive
-                FROM covid19_global
-                WHERE Date = (SELECT MAX(Date) FROM covid19_global)
-            """))
+            row = global_totals(conn)
             print("Global Totals:")
-            for row in result:
-                print(f"  Confirmed: {row[0]:,}")
-                print(f"  Deaths: {row[1]:,}")
-                print(f"  Recovered: {row[2]:,}")
-                print(f"  Active: {row[3]:,}")
+            print(f"  Confirmed: {row[0]:,}")
+            print(f"  Deaths: {row[1]:,}")
+            print(f"  Recovered: {row[2]:,}")
+            print(f"  Active: {row[3]:,}")
             
             # Monthly growth trends
-            result = conn.execute(text("""
-                SELECT 
-                    strftime('%Y-%m', Date) as YearMonth,
-                    SUM(New_Confirmed) as NewCases,
-                    SUM(New_Deaths) as NewDeaths,
-                    SUM(New_Recovered) as NewRecovered
-                FROM covid19_global
-                GROUP BY YearMonth
-                ORDER BY YearMonth
-                LIMIT 12
-            """))
             print("Monthly Growth Trends (Last 12 months):")
-            for row in result:
+            for row in monthly_trends(conn, 12):
                 print(f"  {row[0]}: {row[1]:,} new cases, {row[2]:,} deaths, {row[3]:,} recovered")
                 
             # Countries with highest mortality rates
-            result = conn.execute(text("""
-                SELECT 
-                    "Country/Region",
-                    SUM(Confirmed) as TotalConfirmed,
-                    SUM(Deaths) as TotalDeaths,
-                    ROUND((SUM(Deaths) * 100.0 / SUM(Confirmed)), 2) as MortalityRate
-                FROM covid19_global
-                WHERE Date = (SELECT MAX(Date) FROM covid19_global)
-                    AND Confirmed > 1000
-                GROUP BY "Country/Region"
-                ORDER BY MortalityRate DESC
-                LIMIT 5
-            """))
             print("Countries with Highest Mortality Rates:")
-            for row in result:
+            for row in highest_mortality(conn, 5):
                 print(f"  {row[0]}: {row[3]}% ({row[2]:,} deaths)")
+        
+        return True
                 
     except Exception as e:
         print(f"Error setting up database: {e}")
+        return False
 
 if __name__ == "__main__":
     print("Setting up COVID-19 SQL database...")
-    setup_covid_database()
\ No newline at end of file
+    setup_covid_database()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from covid_tracing import file_size, span
+
+COMBINED_DIR = 'data/combined'
+COMBINED_CSV = 'data/covid19_combined_global.csv'
+
+PARTITION_COLUMNS = ['Year', 'Month']
+
+def _partition_dir(root, year, month):
+    return os.path.join(root, f'Year={year}', f'Month={month}')
+
+def write_partitions(df, root=COMBINED_DIR):
+    """Write rows as Parquet files under Year=YYYY/Month=M partitions
+
+    Each call adds one file per touched month, named after the first and last
+    date it holds, so later appends never rewrite existing files.
+    """
+    dates = pd.to_datetime(df['Date'])
+    data = df.drop(columns=PARTITION_COLUMNS, errors='ignore')
+    written = []
+    for (year, month), part in data.groupby([dates.dt.year, dates.dt.month], sort=True):
+        part_dates = dates.loc[part.index]
+        directory = _partition_dir(root, year, month)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, f"part-{part_dates.min():%Y%m%d}-{part_dates.max():%Y%m%d}.parquet"
+        )
+        table = pa.Table.from_pandas(part, preserve_index=False)
+        pq.write_table(table, path, compression='zstd')
+        written.append(path)
+    return written
+
+def save_combined(df, root=COMBINED_DIR, export_csv=False, csv_path=COMBINED_CSV):
+    """Replace the stored combined dataset, optionally also exporting it as CSV"""
+    with span('storage.save', rows_in=len(df)) as trace:
+        tmp_root = root.rstrip('/') + '.tmp'
+        if os.path.exists(tmp_root):
+            shutil.rmtree(tmp_root)
+        written = write_partitions(df, tmp_root)
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.replace(tmp_root, root)
+        print(f"Saved combined dataset: {root}/")
+        trace.bytes_written = sum(os.path.getsize(p.replace(tmp_root, root, 1)) for p in written)
+
+        if export_csv:
+            df.to_csv(csv_path, index=False)
+            print(f"Exported combined dataset: {csv_path}")
+            trace.bytes_written += file_size(csv_path) or 0
+
+def append_combined(df, root=COMBINED_DIR, export_csv=False, csv_path=COMBINED_CSV):
+    """Append rows for new dates to the stored combined dataset"""
+    if df.empty:
+        return
+    with span('storage.append', rows_in=len(df)) as trace:
+        written = write_partitions(df, root)
+        print(f"Appended {len(df):,} rows to combined dataset: {root}/")
+        trace.bytes_written = sum(os.path.getsize(p) for p in written)
+
+        if export_csv:
+            header = not os.path.exists(csv_path)
+            df.to_csv(csv_path, mode='a', header=header, index=False)
+            print(f"Appended to export: {csv_path}")
+
+def has_columnar(root=COMBINED_DIR):
+    """Return True if a partitioned combined dataset exists under root"""
+    return os.path.isdir(root) and any(name.startswith('Year=') for name in os.listdir(root))
+
+def store_fingerprint(root=COMBINED_DIR):
+    """Hash of the stored partition files' names, sizes and modification times
+
+    Changes whenever the store is rewritten or appended to, so derived data
+    (such as the data cube) can record which version of the store it came from.
+    Returns None if there is no columnar store.
+    """
+    if not has_columnar(root):
+        return None
+    digest = hashlib.sha256()
+    for directory, _, names in sorted(os.walk(root)):
+        for name in sorted(names):
+            stat = os.stat(os.path.join(directory, name))
+            digest.update(f"{os.path.relpath(os.path.join(directory, name), root)}|{stat.st_size}|"
+                          f"{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def _open_dataset(root):
+    return ds.dataset(root, format='parquet', partitioning='hive')
+
+def _date_filter(start, end):
+    """Build a filter on Date that also prunes Year/Month partitions"""
+    expr = None
+    year, month = ds.field('Year'), ds.field('Month')
+    if start is not None:
+        start = pd.Timestamp(start)
+        expr = ((year > start.year) | ((year == start.year) & (month >= start.month))) \
+            & (ds.field('Date') >= pa.scalar(start.to_pydatetime()))
+    if end is not None:
+        end = pd.Timestamp(end)
+        end_expr = ((year < end.year) | ((year == end.year) & (month <= end.month))) \
+            & (ds.field('Date') <= pa.scalar(end.to_pydatetime()))
+        expr = end_expr if expr is None else expr & end_expr
+    return expr
+
+def load_combined(columns=None, start=None, end=None, root=COMBINED_DIR, csv_path=COMBINED_CSV):
+    """Load the combined dataset, reading only the requested columns and date range
+
+    Reads the partitioned Parquet store when present and falls back to the CSV
+    export otherwise. Rows are returned in storage order (by month).
+    """
+    if columns is not None and 'Date' not in columns and (start is not None or end is not None):
+        read_columns = list(columns) + ['Date']
+    else:
+        read_columns = columns
+
+    with span('storage.load') as trace:
+        if has_columnar(root):
+            table = _open_dataset(root).to_table(columns=read_columns, filter=_date_filter(start, end))
+            trace.bytes_read = table.nbytes
+            df = table.to_pandas()
+            for column in PARTITION_COLUMNS:
+                if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+                    df[column] = df[column].astype('int64')
+        else:
+            df = pd.read_csv(csv_path, usecols=read_columns)
+            trace.bytes_read = file_size(csv_path)
+            if 'Date' in df.columns:
+                df['Date'] = pd.to_datetime(df['Date'])
+                if start is not None:
+                    df = df[df['Date'] >= pd.Timestamp(start)]
+                if end is not None:
+                    df = df[df['Date'] <= pd.Timestamp(end)]
+        trace.rows_out = len(df)
+
+    if columns is not None:
+        df = df[list(columns)]
+    elif 'DayOfWeek' in df.columns:
+        # Partition columns come back last; restore the combined column order
+        ordered = [c for c in df.columns if c not in PARTITION_COLUMNS]
+        position = ordered.index('DayOfWeek')
+        df = df[ordered[:position] + PARTITION_COLUMNS + ordered[position:]]
+    return df.reset_index(drop=True)
+
+def latest_date(root=COMBINED_DIR, csv_path=COMBINED_CSV):
+    """Return the most recent Date in the store, reading only the newest partition"""
+    if not has_columnar(root):
+        return pd.to_datetime(pd.read_csv(csv_path, usecols=['Date'])['Date']).max()
+
+    partitions = []
+    for year_dir in os.listdir(root):
+        if not year_dir.startswith('Year='):
+            continue
+        for month_dir in os.listdir(os.path.join(root, year_dir)):
+            if month_dir.startswith('Month='):
+                partitions.append((int(year_dir[5:]), int(month_dir[6:])))
+    if not partitions:
+        return None
+    year, month = max(partitions)
+    table = pq.ParquetDataset(_partition_dir(root, year, month)).read(columns=['Date'])
+    return pd.Timestamp(pc.max(table['Date']).as_py())
+
+def load_latest(columns=None, root=COMBINED_DIR, csv_path=COMBINED_CSV):
+    """Load only the rows for the most recent date"""
+    date = latest_date(root, csv_path)
+    return load_combined(columns=columns, start=date, end=date, root=root, csv_path=csv_path)
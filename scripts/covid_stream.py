@@ -0,0 +1,203 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from covid_tracing import file_size, span
+from data_download import (DATE_HEADER, DAY_NAMES, ID_COLUMNS, US_ID_COLUMNS, _safe_rate,
+                           dataset_path, parse_date_columns)
+
+# Source presets: metric -> local data type, the ID columns carried into the output,
+# and the columns that identify a row across the metric files
+SOURCES = {
+    'global': {
+        'files': {'Confirmed': 'confirmed', 'Deaths': 'deaths', 'Recovered': 'recovered'},
+        'id_columns': ID_COLUMNS,
+        'key': ID_COLUMNS,
+    },
+    'us': {
+        'files': {'Confirmed': 'confirmed_US', 'Deaths': 'deaths_US'},
+        'id_columns': US_ID_COLUMNS,
+        'key': ['UID'],
+    },
+}
+
+DEFAULT_MEMORY_LIMIT_MB = 256
+
+# Headroom for the intermediate arrays built next to each block's long frame
+BLOCK_OVERHEAD = 3
+
+def _date_columns(path):
+    header = pd.read_csv(path, nrows=0).columns
+    return [c for c in header if DATE_HEADER.match(c)]
+
+def _spill_metric(path, key, date_columns, chunk_rows, directory):
+    """Copy one wide file's values into a memory-mapped (row x date) array, chunk by chunk
+
+    Returns the memmap, a unique index of the file's row keys and the row
+    position of each key (the first, if a key repeats), so rows can later be
+    looked up in any order without holding the file in memory.
+    """
+    keys = pd.read_csv(path, usecols=key)[key]
+    index = pd.MultiIndex.from_frame(keys) if len(key) > 1 else pd.Index(keys[key[0]])
+    first = ~index.duplicated()
+    values = np.lib.format.open_memmap(
+        os.path.join(directory, os.path.basename(path) + '.npy'),
+        mode='w+', dtype='float64', shape=(len(keys), len(date_columns)),
+    )
+    available = set(_date_columns(path))
+    wanted = [c for c in date_columns if c in available]
+    offset = 0
+    for chunk in pd.read_csv(path, usecols=wanted, chunksize=chunk_rows):
+        values[offset:offset + len(chunk)] = chunk.reindex(columns=date_columns).to_numpy(dtype='float64')
+        offset += len(chunk)
+    return values, index[first], np.flatnonzero(first)
+
+def _estimate_block_rows(n_days, n_id_columns, memory_limit_mb, n_metrics):
+    """Number of wide rows per block so one block's long output stays under the ceiling"""
+    # Per long row: one 8-byte slot per ID column plus ~60 bytes of string payload,
+    # Date, counts, New_*, rates and time features
+    long_row_bytes = 8 * n_id_columns + 60 + 8 * (1 + 3 * n_metrics + 6)
+    per_wide_row = n_days * long_row_bytes * BLOCK_OVERHEAD
+    return max(1, int(memory_limit_mb * 1024 * 1024 // per_wide_row))
+
+def _long_block(ids, metrics, dates, day_names):
+    """Build the long frame for one block of locations from (location x date) arrays"""
+    n_rows, n_days = next(iter(metrics.values())).shape
+    loc_index = np.repeat(np.arange(n_rows), n_days)
+    date_index = np.tile(np.arange(n_days), n_rows)
+
+    block = {column: ids[column].to_numpy()[loc_index] for column in ids.columns}
+    block['Date'] = dates.values[date_index]
+    for name, values in metrics.items():
+        block[name] = values.ravel().astype('int64')
+    if {'Confirmed', 'Deaths', 'Recovered'} <= metrics.keys():
+        block['Active'] = (metrics['Confirmed'] - metrics['Deaths'] - metrics['Recovered']).ravel().astype('int64')
+    for name, values in metrics.items():
+        # Each row holds a location's full series, so diffs never cross a block
+        new = np.empty_like(values)
+        new[:, 0] = 0
+        np.subtract(values[:, 1:], values[:, :-1], out=new[:, 1:])
+        block[f'New_{name}'] = new.ravel().astype('int64')
+    if 'Deaths' in metrics:
+        block['Mortality_Rate'] = _safe_rate(metrics['Deaths'], metrics['Confirmed']).ravel()
+    if 'Recovered' in metrics:
+        block['Recovery_Rate'] = _safe_rate(metrics['Recovered'], metrics['Confirmed']).ravel()
+    block['Year'] = dates.year.to_numpy()[date_index]
+    block['Month'] = dates.month.to_numpy()[date_index]
+    block['DayOfWeek'] = day_names[date_index]
+    return pd.DataFrame(block)
+
+class _BlockWriter:
+    """Append blocks to one Parquet file (a row group per block) or a CSV file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_parquet = path.endswith('.parquet')
+        self.writer = None
+        self.schema = None
+        self.tmp_path = path + '.tmp'
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def write(self, block):
+        if not self.is_parquet:
+            block.to_csv(self.tmp_path, mode='a', header=self.writer is None, index=False)
+            self.writer = True
+            return
+        table = pa.Table.from_pandas(block, preserve_index=False)
+        if self.writer is None:
+            # All-null columns in the first block (e.g. no provinces) must stay strings
+            self.schema = pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ]).remove_metadata()
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self, success=True):
+        """Finish the file; only a successful write replaces the existing output"""
+        if self.is_parquet and self.writer is not None:
+            self.writer.close()
+        if self.writer is not None and success:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def stream_combined_dataset(source='global', output_path=None, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                            data_dir='data'):
+    """Combine wide time series block by block with bounded memory
+
+    The first metric's file is read in blocks of whole rows sized from
+    memory_limit_mb; the other metrics are first spilled to memory-mapped arrays
+    so their rows can be matched by key in any order. Each location's whole
+    series stays in one block, so New_* diffs and rates are exact. Blocks are
+    written as they are built to a Parquet file (one row group per block) or, if
+    output_path ends in .csv, a CSV file. Rows come out location by location.
+    Returns a dict with row, block and size statistics.
+    """
+    preset = SOURCES[source]
+    metric_paths = {metric: dataset_path(data_type, data_dir) for metric, data_type in preset['files'].items()}
+    primary_metric = next(iter(metric_paths))
+    primary_path = metric_paths[primary_metric]
+    id_columns, key = preset['id_columns'], preset['key']
+    output_path = output_path or os.path.join(data_dir, f'covid19_combined_{source}.parquet')
+
+    date_columns = _date_columns(primary_path)
+    dates = parse_date_columns(date_columns)
+    day_names = np.array(DAY_NAMES, dtype=object)[dates.dayofweek.to_numpy()]
+    block_rows = _estimate_block_rows(len(date_columns), len(id_columns), memory_limit_mb, len(metric_paths))
+    print(f"Streaming {source} series: {len(date_columns)} dates, {block_rows:,} locations per block "
+          f"(limit {memory_limit_mb} MB)")
+
+    stats = {'rows_in': 0, 'rows_out': 0, 'blocks': 0, 'block_rows': block_rows}
+    with span(f'combine.stream.{source}') as trace, tempfile.TemporaryDirectory(prefix='covid-stream-') as spill_dir:
+        secondary = {
+            metric: _spill_metric(path, key, date_columns, block_rows, spill_dir)
+            for metric, path in metric_paths.items() if metric != primary_metric
+        }
+        writer = _BlockWriter(output_path)
+        success = False
+        try:
+            reader = pd.read_csv(primary_path, usecols=id_columns + date_columns, chunksize=block_rows)
+            for chunk in reader:
+                ids = chunk[id_columns].reset_index(drop=True)
+                metrics = {primary_metric: np.nan_to_num(chunk[date_columns].to_numpy(dtype='float64'), nan=0.0)}
+                chunk_keys = (pd.MultiIndex.from_frame(chunk[key]) if len(key) > 1
+                              else pd.Index(chunk[key[0]]))
+                for metric, (values, index, positions) in secondary.items():
+                    matches = index.get_indexer(chunk_keys)
+                    aligned = np.zeros((len(chunk), len(date_columns)))
+                    found = matches >= 0
+                    aligned[found] = values[positions[matches[found]]]
+                    metrics[metric] = np.nan_to_num(aligned, nan=0.0)
+
+                block = _long_block(ids, metrics, dates, day_names)
+                writer.write(block)
+                stats['rows_in'] += len(chunk)
+                stats['rows_out'] += len(block)
+                stats['blocks'] += 1
+            success = True
+        finally:
+            writer.close(success)
+        stats['bytes_written'] = file_size(output_path) or 0
+        trace.rows_in = stats['rows_in']
+        trace.rows_out = stats['rows_out']
+        trace.bytes_read = sum(file_size(path) or 0 for path in metric_paths.values())
+        trace.bytes_written = stats['bytes_written']
+
+    print(f"Saved streamed dataset: {output_path} ({stats['rows_out']:,} rows in {stats['blocks']} blocks)")
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Combine wide JHU time series with bounded memory")
+    parser.add_argument('source', choices=list(SOURCES), nargs='?', default='us')
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT_MB,
+                        help=f"Memory ceiling in MB for one block (default: {DEFAULT_MEMORY_LIMIT_MB})")
+    parser.add_argument('--output', default=None, help="Output .parquet or .csv path")
+    args = parser.parse_args()
+    stream_combined_dataset(args.source, output_path=args.output, memory_limit_mb=args.memory_limit)
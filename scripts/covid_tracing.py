@@ -0,0 +1,174 @@
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# Tracing is configured from the environment so scripts started as subprocesses
+# inherit it: COVID_TRACE=<jsonl path>, COVID_PROFILE=<span,names>, COVID_TRACE_MEMORY=0
+_config = {
+    'path': os.environ.get('COVID_TRACE') or None,
+    'profile': {name for name in os.environ.get('COVID_PROFILE', '').split(',') if name},
+    'memory': os.environ.get('COVID_TRACE_MEMORY', '1') != '0',
+}
+_write_lock = threading.Lock()
+_local = threading.local()
+
+def configure(path=None, profile=(), memory=True):
+    """Enable tracing to a JSON-lines file (path=None disables it)
+
+    profile lists span names to also run under cProfile; their stats are dumped
+    next to the trace file as <name>.prof. memory=True tracks peak Python heap
+    usage per span with tracemalloc.
+    """
+    _config['path'] = path
+    _config['profile'] = set(profile)
+    _config['memory'] = memory
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+def enabled():
+    """Return True if spans are being recorded"""
+    return _config['path'] is not None
+
+class Span:
+    """Measurements for one traced block; callers fill in the row and byte counts"""
+
+    __slots__ = ('name', 'rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'child_peak')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.child_peak = 0
+
+class _NullSpan:
+    """Shared no-op context and span used when tracing is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _write(record):
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        with open(_config['path'], 'a') as f:
+            f.write(line + '\n')
+
+@contextmanager
+def _recording_span(name, **counts):
+    current = Span(name)
+    for key, value in counts.items():
+        setattr(current, key, value)
+
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    track_memory = _config['memory']
+    if track_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if parent is not None:
+            parent.child_peak = max(parent.child_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    profiler = None
+    if name in _config['profile']:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    stack.append(current)
+    status, error = 'ok', None
+    start_time = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield current
+    except BaseException as e:
+        status, error = 'error', f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stack.pop()
+        if profiler is not None:
+            profiler.disable()
+            profile_path = os.path.join(os.path.dirname(_config['path']) or '.', f"{name}.prof")
+            profiler.dump_stats(profile_path)
+
+        peak = None
+        if track_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], current.child_peak)
+            if parent is not None:
+                parent.child_peak = max(parent.child_peak, peak)
+            tracemalloc.reset_peak()
+
+        _write({
+            'name': name,
+            'parent': parent.name if parent is not None else None,
+            'start': start_time,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_mem_bytes': peak,
+            'rows_in': current.rows_in,
+            'rows_out': current.rows_out,
+            'bytes_read': current.bytes_read,
+            'bytes_written': current.bytes_written,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'status': status,
+            'error': error,
+        })
+
+def span(name, **counts):
+    """Context manager timing a block; yields a Span to record rows/bytes on
+
+    Records wall time, process CPU time, peak traced heap (nested spans included),
+    rows in/out and bytes read/written as one JSON line when the block exits.
+    Exceptions are recorded and re-raised. When tracing is disabled this returns
+    a no-op context. CPU time and heap peaks are process-wide, so spans running
+    in parallel threads overlap in those two measurements.
+    """
+    if _config['path'] is None:
+        return _NULL_SPAN
+    return _recording_span(name, **counts)
+
+def traced(name=None):
+    """Decorator form of span() for functions that do not report counts"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _config['path'] is None:
+                return func(*args, **kwargs)
+            with _recording_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def file_size(path):
+    """Size of a file in bytes, or None if it does not exist"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
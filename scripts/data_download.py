@@ -1,143 +1,566 @@
 import pandas as pd
-import requests
+import numpy as np
 import os
+import csv
+import gzip
+import hashlib
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-def download_covid_data():
-    """Download COVID-19 data from Johns Hopkins University"""
+from covid_storage import COMBINED_DIR, append_combined, has_columnar, latest_date, save_combined
+from covid_tracing import file_size, span, traced
+
+# Johns Hopkins COVID-19 data URLs
+JHU_BASE_URL = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/"
+
+DATASETS = {
+    'confirmed': 'time_series_covid19_confirmed_global.csv',
+    'deaths': 'time_series_covid19_deaths_global.csv', 
+    'recovered': 'time_series_covid19_recovered_global.csv'
+}
+
+# County-level US series: same date layout, no recovered file, keyed by UID
+US_DATASETS = {
+    'confirmed_US': 'time_series_covid19_confirmed_US.csv',
+    'deaths_US': 'time_series_covid19_deaths_US.csv',
+}
+
+ID_COLUMNS = ['Province/State', 'Country/Region', 'Lat', 'Long']
+
+US_ID_COLUMNS = ['UID', 'FIPS', 'Admin2', 'Province_State', 'Country_Region', 'Lat', 'Long_', 'Combined_Key']
+
+# JHU date headers look like 1/22/20
+DATE_HEADER = re.compile(r'^\d{1,2}/\d{1,2}/\d{2,4}$')
+
+def load_download_cache(cache_path):
+    """Load stored ETag/Last-Modified/hash metadata for previous downloads"""
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_download_cache(cache, cache_path):
+    """Persist download metadata atomically"""
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+def _header_columns(first_line):
+    """Return the column names from the first line of a CSV payload"""
+    return next(csv.reader([first_line.decode('utf-8-sig').strip()]))
+
+def _local_filename(data_type):
+    """Global series keep their historical names; US series are named after their key"""
+    if data_type in US_DATASETS:
+        return f'covid19_{data_type}.csv'
+    return f'covid19_{data_type}_global.csv'
+
+def dataset_path(data_type, data_dir='data'):
+    """Return the local path of a downloaded time series, preferring gzip output"""
+    path = os.path.join(data_dir, _local_filename(data_type))
+    if os.path.exists(path + '.gz'):
+        return path + '.gz'
+    return path
+
+def fetch_dataset(session, url, output_path, entry, timeout=60, compress=False, chunk_size=1 << 16,
+                  required_columns=ID_COLUMNS):
+    """Conditionally fetch one wide time-series CSV, streaming it to disk
+
+    Sends If-None-Match/If-Modified-Since from the cache entry. The body is
+    written in chunks to a temporary file (gzip-compressed if requested) while
+    being hashed, then validated and moved into place. A 304, or a body that
+    hashes to the stored value, leaves the local file untouched. New dates are
+    picked up afterwards by the incremental combine, which compares the files
+    with the stored dataset rather than with this cache.
+    """
+    final_path = output_path + '.gz' if compress else output_path
+    headers = {}
+    if os.path.exists(final_path):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return 'not_modified', 0
+        response.raise_for_status()
+
+        tmp_path = final_path + '.tmp'
+        digest = hashlib.sha256()
+        nbytes = 0
+        first_line = b''
+        opener = gzip.open if compress else open
+        try:
+            with opener(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    if b'\n' not in first_line:
+                        first_line += chunk
+                    digest.update(chunk)
+                    nbytes += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    entry['etag'] = response.headers.get('ETag', entry.get('etag'))
+    entry['last_modified'] = response.headers.get('Last-Modified', entry.get('last_modified'))
+
+    digest = digest.hexdigest()
+    if digest == entry.get('sha256') and os.path.exists(final_path):
+        os.remove(tmp_path)
+        return 'unchanged', nbytes
+
+    columns = _header_columns(first_line.split(b'\n', 1)[0])
+    missing = [c for c in required_columns if c not in columns]
+    if nbytes == 0 or missing:
+        os.remove(tmp_path)
+        raise ValueError(f"{url} is missing expected columns: {missing}")
+    entry['sha256'] = digest
+
+    os.replace(tmp_path, final_path)
+    # Only one copy of each dataset should be on disk
+    stale_path = output_path if compress else output_path + '.gz'
+    if os.path.exists(stale_path):
+        os.remove(stale_path)
+    return 'updated', nbytes
+
+def fetch_with_retry(url, output_path, entry, retries=3, backoff=1.0, session=None, **kwargs):
+    """Fetch one dataset, retrying with exponential backoff on network errors"""
+    import requests
+    session = session or requests.Session()
+    for attempt in range(retries + 1):
+        try:
+            return fetch_dataset(session, url, output_path, entry, **kwargs)
+        except requests.RequestException as e:
+            # Includes ChunkedEncodingError from a connection dropped mid-body while streaming
+            status = getattr(e.response, 'status_code', None)
+            # Malformed URLs and schemas (ValueError subclasses) will not succeed on retry
+            if (attempt == retries or isinstance(e, ValueError)
+                    or (status is not None and status < 500 and status != 429)):
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"Retrying {url} in {delay:.1f}s ({e})")
+            time.sleep(delay)
+
+def refresh_datasets(base_url=JHU_BASE_URL, data_dir='data', session=None,
+                     concurrent=False, compress=False, retries=3, backoff=1.0,
+                     datasets=DATASETS, required_columns=ID_COLUMNS):
+    """Refresh the local copies of all JHU time series, returning per-file stats
+
+    With concurrent=True every source is fetched on its own thread, each with its
+    own session and retry budget, so one slow file does not hold up the others.
+    Pass datasets=US_DATASETS, required_columns=['UID'] for the county series.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    cache_path = os.path.join(data_dir, 'download_cache.json')
+    cache = load_download_cache(cache_path)
+
+    def fetch(data_type, filename):
+        url = base_url + filename
+        output_path = os.path.join(data_dir, _local_filename(data_type))
+        entry = dict(cache.get(data_type, {}))
+        print(f"Downloading {data_type} data...")
+        start = time.perf_counter()
+        with span(f'download.{data_type}') as trace:
+            status, nbytes = fetch_with_retry(
+                url, output_path, entry, retries=retries, backoff=backoff,
+                session=None if concurrent else session, compress=compress,
+                required_columns=required_columns,
+            )
+            trace.bytes_read = nbytes
+            trace.bytes_written = file_size(dataset_path(data_type, data_dir)) if status == 'updated' else 0
+        elapsed = time.perf_counter() - start
+        print(f"{status.replace('_', ' ').capitalize()}: {dataset_path(data_type, data_dir)} "
+              f"({nbytes:,} bytes, {elapsed:.2f}s)")
+        return entry, {
+            'status': status,
+            'bytes': nbytes,
+            'seconds': elapsed,
+        }
+
+    stats = {}
+    errors = []
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=len(datasets)) as pool:
+            futures = {pool.submit(fetch, data_type, filename): data_type
+                       for data_type, filename in datasets.items()}
+            for future in as_completed(futures):
+                data_type = futures[future]
+                try:
+                    cache[data_type], stats[data_type] = future.result()
+                except Exception as e:
+                    errors.append(f"{data_type}: {e}")
+    else:
+        import requests
+        session = session or requests.Session()
+        for data_type, filename in datasets.items():
+            cache[data_type], stats[data_type] = fetch(data_type, filename)
+            save_download_cache(cache, cache_path)
+
+    # Files that did complete keep their cache entries even if another failed
+    save_download_cache(cache, cache_path)
+    if errors:
+        raise RuntimeError("Failed to download: " + "; ".join(errors))
+    return stats
+
+def download_covid_data(base_url=JHU_BASE_URL, data_dir='data', concurrent=False, compress=False, fallback=True):
+    """Download COVID-19 data from Johns Hopkins University
+
+    On failure, writes the sample dataset to the combined store if fallback is
+    True; otherwise returns False and leaves the store alone.
+    """
     
     print("Downloading COVID-19 data from Johns Hopkins University...")
     
-    # Johns Hopkins COVID-19 data URLs
-    base_url = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/"
-    
-    datasets = {
-        'confirmed': 'time_series_covid19_confirmed_global.csv',
-        'deaths': 'time_series_covid19_deaths_global.csv', 
-        'recovered': 'time_series_covid19_recovered_global.csv'
-    }
-    
     try:
-        # Ensure data directory exists
-        os.makedirs('data', exist_ok=True)
-        
-        for data_type, filename in datasets.items():
-            url = base_url + filename
-            print(f"Downloading {data_type} data...")
-            
-            # Download and save the data
-            df = pd.read_csv(url)
-            output_path = f'data/covid19_{data_type}_global.csv'
-            df.to_csv(output_path, index=False)
-            print(f"Saved: {output_path}")
-            
-        print("All COVID-19 datasets downloaded successfully!")
+        start = time.perf_counter()
+        stats = refresh_datasets(base_url=base_url, data_dir=data_dir,
+                                 concurrent=concurrent, compress=compress)
+        total_bytes = sum(s['bytes'] for s in stats.values())
+        print(f"All COVID-19 datasets up to date ({total_bytes:,} bytes in {time.perf_counter() - start:.2f}s)")
         return True
         
     except Exception as e:
         print(f"Error downloading data: {e}")
+        if not fallback:
+            return False
         print("Creating sample dataset instead...")
         return create_sample_dataset()
 
-def create_sample_dataset():
+SAMPLE_COUNTRIES = ['US', 'India', 'Brazil', 'UK', 'Germany', 'France', 'Italy', 'Spain', 'Russia', 'China']
+
+def generate_sample_data(n_countries=10, n_provinces=1, start='2020-01-01', end='2023-12-31', seed=42):
+    """Generate a deterministic synthetic COVID-19 dataset in combined long format
+
+    Rows are ordered by location then date. Cumulative columns are built as running
+    sums of non-negative daily increments, so they never decrease, and the same
+    arguments always produce the same frame.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start=start, end=end, freq='D')
+    n_days = len(dates)
+
+    countries = SAMPLE_COUNTRIES[:n_countries] + [
+        f"Country_{i + 1:03d}" for i in range(len(SAMPLE_COUNTRIES), n_countries)
+    ]
+    n_locations = n_countries * n_provinces
+    country_codes = np.repeat(np.arange(n_countries), n_provinces)
+    if n_provinces > 1:
+        provinces = np.array([f"Province_{i + 1:03d}" for i in range(n_provinces)], dtype=object)
+        province_values = np.tile(provinces, n_countries)
+    else:
+        province_values = np.full(n_locations, np.nan, dtype=object)
+    lat = rng.uniform(-60, 70, n_locations).round(4)
+    long = rng.uniform(-180, 180, n_locations).round(4)
+
+    # Daily increments per location; scale varies by location so rankings are stable
+    scale = rng.uniform(50, 5000, (n_locations, 1))
+    new_confirmed = rng.poisson(scale, (n_locations, n_days))
+    new_deaths = rng.binomial(new_confirmed, 0.02)
+    new_recovered = rng.binomial(new_confirmed - new_deaths, 0.85)
+
+    confirmed = new_confirmed.cumsum(axis=1)
+    deaths = new_deaths.cumsum(axis=1)
+    recovered = new_recovered.cumsum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mortality_rate = np.nan_to_num(deaths / confirmed * 100)
+        recovery_rate = np.nan_to_num(recovered / confirmed * 100)
+
+    # Time features are computed once per date and tiled, not per row
+    date_values = np.tile(dates.values, n_locations)
+
+    df = pd.DataFrame({
+        'Province/State': np.repeat(province_values, n_days),
+        'Country/Region': np.repeat(np.array(countries, dtype=object)[country_codes], n_days),
+        'Lat': np.repeat(lat, n_days),
+        'Long': np.repeat(long, n_days),
+        'Date': date_values,
+        'Confirmed': confirmed.ravel(),
+        'Deaths': deaths.ravel(),
+        'Recovered': recovered.ravel(),
+        'Active': (confirmed - deaths - recovered).ravel(),
+        'New_Confirmed': new_confirmed.ravel(),
+        'New_Deaths': new_deaths.ravel(),
+        'New_Recovered': new_recovered.ravel(),
+        'Mortality_Rate': mortality_rate.ravel(),
+        'Recovery_Rate': recovery_rate.ravel(),
+        'Year': np.tile(dates.year.values, n_locations),
+        'Month': np.tile(dates.month.values, n_locations),
+        'DayOfWeek': np.tile(dates.day_name().values, n_locations),
+    })
+    return df
+
+@traced('sample_dataset')
+def create_sample_dataset(n_countries=10, n_provinces=1, start='2020-01-01', end='2023-12-31', seed=42,
+                          export_csv=False):
     """Create sample COVID-19 data for testing"""
     print("Creating sample COVID-19 dataset...")
     
-    # Create sample data
-    dates = pd.date_range(start='2020-01-01', end='2023-12-31', freq='D')
-    countries = ['US', 'India', 'Brazil', 'UK', 'Germany', 'France', 'Italy', 'Spain', 'Russia', 'China']
-    
-    sample_data = []
-    for date in dates:
-        for country in countries:
-            confirmed = abs(hash(f"{country}{date}")) % 10000000
-            deaths = int(confirmed * 0.02)  # 2% mortality
-            recovered = int(confirmed * 0.85)  # 85% recovery
-            active = confirmed - deaths - recovered
-            
-            sample_data.append({
-                'Country/Region': country,
-                'Date': date,
-                'Confirmed': confirmed,
-                'Deaths': deaths,
-                'Recovered': recovered,
-                'Active': active,
-                'New_Confirmed': abs(hash(f"new{country}{date}")) % 10000,
-                'New_Deaths': abs(hash(f"death{country}{date}")) % 100,
-                'New_Recovered': abs(hash(f"recover{country}{date}")) % 5000,
-                'Mortality_Rate': 2.0,
-                'Recovery_Rate': 85.0,
-                'Year': date.year,
-                'Month': date.month,
-                'DayOfWeek': date.day_name()
-            })
-    
-    df = pd.DataFrame(sample_data)
+    df = generate_sample_data(n_countries=n_countries, n_provinces=n_provinces,
+                              start=start, end=end, seed=seed)
     
     # Ensure data directory exists
     os.makedirs('data', exist_ok=True)
     
     # Save the dataset
-    df.to_csv('data/covid19_combined_global.csv', index=False)
-    print("Sample dataset created: data/covid19_combined_global.csv")
+    save_combined(df, export_csv=export_csv)
+    print(f"Sample dataset created: {COMBINED_DIR}/")
     print(f"Records: {len(df)}")
     print(f"Countries: {df['Country/Region'].nunique()}")
     print(f"Date range: {df['Date'].min()} to {df['Date'].max()}")
     
     return True
 
-def create_combined_dataset():
-    """Create combined dataset from downloaded files"""
+COMBINED_COLUMNS = [
+    'Province/State', 'Country/Region', 'Lat', 'Long', 'Date',
+    'Confirmed', 'Deaths', 'Recovered', 'Active',
+    'New_Confirmed', 'New_Deaths', 'New_Recovered',
+    'Mortality_Rate', 'Recovery_Rate', 'Year', 'Month', 'DayOfWeek'
+]
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def parse_date_columns(columns):
+    """Parse JHU date headers (e.g. '1/22/20') once per column rather than once per row"""
     try:
-        print("Creating combined dataset...")
-        
-        confirmed = pd.read_csv('data/covid19_confirmed_global.csv')
-        deaths = pd.read_csv('data/covid19_deaths_global.csv')
-        recovered = pd.read_csv('data/covid19_recovered_global.csv')
-        
-        print("Loaded datasets successfully")
-        
-        # Melt datasets to long format
-        def melt_dataframe(df, value_name):
-            id_vars = ['Province/State', 'Country/Region', 'Lat', 'Long']
-            melted_df = df.melt(id_vars=id_vars, var_name='Date', value_name=value_name)
-            melted_df['Date'] = pd.to_datetime(melted_df['Date'])
-            return melted_df
-        
-        confirmed_long = melt_dataframe(confirmed, 'Confirmed')
-        deaths_long = melt_dataframe(deaths, 'Deaths')
-        recovered_long = melt_dataframe(recovered, 'Recovered')
-        
-        # Merge datasets
-        merged_df = confirmed_long.merge(
-            deaths_long, on=['Province/State', 'Country/Region', 'Lat', 'Long', 'Date'], how='left'
-        ).merge(
-            recovered_long, on=['Province/State', 'Country/Region', 'Lat', 'Long', 'Date'], how='left'
+        return pd.to_datetime(pd.Index(columns), format='%m/%d/%y')
+    except ValueError:
+        return pd.to_datetime(pd.Index(columns))
+
+def align_metric(wide_df, locations, date_columns):
+    """Return a (location x date) array of wide_df aligned to the given location keys
+
+    Locations missing from wide_df, and dates it does not have, are filled with 0,
+    matching the left merge of the melt-based path.
+    """
+    wide_df = wide_df.drop_duplicates(subset=ID_COLUMNS)
+    keys = pd.MultiIndex.from_frame(wide_df[ID_COLUMNS])
+    rows = keys.get_indexer(locations)
+    values = wide_df.reindex(columns=date_columns).to_numpy(dtype='float64')
+    aligned = np.where(rows[:, None] >= 0, values[rows], np.nan)
+    return np.nan_to_num(aligned, nan=0.0)
+
+def _safe_rate(numerator, denominator):
+    """Percentage with 0 in place of 0/0, mirroring Series division plus fillna(0)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = numerator / denominator * 100
+    return np.where(np.isnan(rate), 0.0, rate)
+
+def combine_aligned(confirmed, deaths, recovered, compact=False):
+    """Combine the three wide time series by aligning them on location keys
+
+    All files share the same date layout, so each metric becomes one
+    (location x date) array aligned to the confirmed rows; daily deltas are a
+    single diff along the date axis. Only the final long frame is materialized.
+    With compact=True, countries, provinces and weekdays are categoricals,
+    counts are int32 (int64 if they would overflow), rates float32 and
+    Year/Month small integers.
+    """
+    date_columns = [c for c in confirmed.columns if c not in ID_COLUMNS]
+    dates = parse_date_columns(date_columns)
+    locations = pd.MultiIndex.from_frame(confirmed[ID_COLUMNS])
+    n_locations, n_days = len(locations), len(dates)
+
+    confirmed_values = np.nan_to_num(confirmed[date_columns].to_numpy(dtype='float64'), nan=0.0)
+    deaths_values = align_metric(deaths, locations, date_columns)
+    recovered_values = align_metric(recovered, locations, date_columns)
+    active_values = confirmed_values - deaths_values - recovered_values
+
+    def daily_new(values):
+        new = np.empty_like(values)
+        new[:, 0] = 0
+        np.subtract(values[:, 1:], values[:, :-1], out=new[:, 1:])
+        return new
+
+    # Same row order as sorting the long frame by country then date: locations
+    # keep their file order within a country and rows are date-major per country
+    country_codes, countries = pd.factorize(confirmed['Country/Region'], sort=True)
+    loc_index = np.repeat(np.arange(n_locations), n_days)
+    date_index = np.tile(np.arange(n_days), n_locations)
+    order = np.lexsort((loc_index, date_index, country_codes[loc_index]))
+    loc_index = loc_index[order]
+    date_index = date_index[order]
+    flat = loc_index * n_days + date_index
+
+    def column(values):
+        return values.ravel()[flat]
+
+    # int32 only while every value fits; Active and the daily deltas stay within
+    # twice the largest count
+    fits = max(np.abs(values).max(initial=0) for values in (confirmed_values, deaths_values,
+                                                              recovered_values)) < 2 ** 30
+    count_dtype = 'int32' if compact and fits else 'int64'
+    new_dtype = count_dtype if compact else 'float64'
+    rate_dtype = 'float32' if compact else 'float64'
+
+    provinces = confirmed['Province/State'].to_numpy(dtype=object)
+    countries_col = confirmed['Country/Region'].to_numpy(dtype=object)
+    if compact:
+        province_col = pd.Categorical(provinces[loc_index])
+        country_col = pd.Categorical.from_codes(country_codes[loc_index], categories=countries)
+        years = dates.year.to_numpy().astype('int16')[date_index]
+        months = dates.month.to_numpy().astype('int8')[date_index]
+        weekday = pd.Categorical.from_codes(
+            dates.dayofweek.to_numpy()[date_index], categories=DAY_NAMES, ordered=True
         )
-        
-        # Clean and calculate metrics
-        merged_df['Deaths'] = merged_df['Deaths'].fillna(0)
-        merged_df['Recovered'] = merged_df['Recovered'].fillna(0)
-        merged_df['Active'] = merged_df['Confirmed'] - merged_df['Deaths'] - merged_df['Recovered']
-        
-        # Calculate daily new cases
-        merged_df = merged_df.sort_values(['Country/Region', 'Date'])
-        merged_df['New_Confirmed'] = merged_df.groupby('Country/Region')['Confirmed'].diff().fillna(0)
-        merged_df['New_Deaths'] = merged_df.groupby('Country/Region')['Deaths'].diff().fillna(0)
-        merged_df['New_Recovered'] = merged_df.groupby('Country/Region')['Recovered'].diff().fillna(0)
-        
-        # Calculate rates
-        merged_df['Mortality_Rate'] = (merged_df['Deaths'] / merged_df['Confirmed'] * 100).fillna(0)
-        merged_df['Recovery_Rate'] = (merged_df['Recovered'] / merged_df['Confirmed'] * 100).fillna(0)
-        
-        # Add time features
-        merged_df['Year'] = merged_df['Date'].dt.year
-        merged_df['Month'] = merged_df['Date'].dt.month
-        merged_df['DayOfWeek'] = merged_df['Date'].dt.day_name()
-        
-        # Save combined dataset
-        merged_df.to_csv('data/covid19_combined_global.csv', index=False)
-        print("Saved combined dataset: data/covid19_combined_global.csv")
+    else:
+        province_col = provinces[loc_index]
+        country_col = countries_col[loc_index]
+        years = dates.year.to_numpy()[date_index]
+        months = dates.month.to_numpy()[date_index]
+        weekday = np.array(DAY_NAMES, dtype=object)[dates.dayofweek.to_numpy()[date_index]]
+
+    combined = pd.DataFrame({
+        'Province/State': province_col,
+        'Country/Region': country_col,
+        'Lat': confirmed['Lat'].to_numpy()[loc_index],
+        'Long': confirmed['Long'].to_numpy()[loc_index],
+        'Date': dates.values[date_index],
+        'Confirmed': column(confirmed_values).astype(count_dtype),
+        'Deaths': column(deaths_values).astype(count_dtype),
+        'Recovered': column(recovered_values).astype(count_dtype),
+        'Active': column(active_values).astype(count_dtype),
+        'New_Confirmed': column(daily_new(confirmed_values)).astype(new_dtype),
+        'New_Deaths': column(daily_new(deaths_values)).astype(new_dtype),
+        'New_Recovered': column(daily_new(recovered_values)).astype(new_dtype),
+        'Mortality_Rate': column(_safe_rate(deaths_values, confirmed_values)).astype(rate_dtype),
+        'Recovery_Rate': column(_safe_rate(recovered_values, confirmed_values)).astype(rate_dtype),
+        'Year': years,
+        'Month': months,
+        'DayOfWeek': weekday,
+    })
+    return combined
+
+def combine_melted(confirmed, deaths, recovered):
+    """Combine the three wide time series by melting and merging on all keys
+
+    Reference implementation kept for comparison with combine_aligned.
+    """
+    # Melt datasets to long format
+    def melt_dataframe(df, value_name):
+        melted_df = df.melt(id_vars=ID_COLUMNS, var_name='Date', value_name=value_name)
+        melted_df['Date'] = pd.to_datetime(melted_df['Date'])
+        return melted_df
+    
+    confirmed_long = melt_dataframe(confirmed, 'Confirmed')
+    deaths_long = melt_dataframe(deaths, 'Deaths')
+    recovered_long = melt_dataframe(recovered, 'Recovered')
+    
+    # Merge datasets
+    merged_df = confirmed_long.merge(
+        deaths_long, on=ID_COLUMNS + ['Date'], how='left'
+    ).merge(
+        recovered_long, on=ID_COLUMNS + ['Date'], how='left'
+    )
+    
+    # Clean and calculate metrics
+    merged_df['Deaths'] = merged_df['Deaths'].fillna(0)
+    merged_df['Recovered'] = merged_df['Recovered'].fillna(0)
+    merged_df['Active'] = merged_df['Confirmed'] - merged_df['Deaths'] - merged_df['Recovered']
+    
+    # Calculate daily new cases per location (province rows of one country are separate series)
+    merged_df = merged_df.sort_values(['Country/Region', 'Date'])
+    by_location = merged_df.groupby(ID_COLUMNS, dropna=False, sort=False)
+    merged_df['New_Confirmed'] = by_location['Confirmed'].diff().fillna(0)
+    merged_df['New_Deaths'] = by_location['Deaths'].diff().fillna(0)
+    merged_df['New_Recovered'] = by_location['Recovered'].diff().fillna(0)
+    
+    # Calculate rates
+    merged_df['Mortality_Rate'] = (merged_df['Deaths'] / merged_df['Confirmed'] * 100).fillna(0)
+    merged_df['Recovery_Rate'] = (merged_df['Recovered'] / merged_df['Confirmed'] * 100).fillna(0)
+    
+    # Add time features
+    merged_df['Year'] = merged_df['Date'].dt.year
+    merged_df['Month'] = merged_df['Date'].dt.month
+    merged_df['DayOfWeek'] = merged_df['Date'].dt.day_name()
+    
+    return merged_df
+
+def combine_new_dates(stored_latest, compact=True):
+    """Build combined rows only for the dates after stored_latest
+
+    Only the ID columns, the last stored date and the new date columns are parsed
+    from each wide file; the stored day seeds the New_* diffs and is then dropped.
+    Returns None when the stored day is no longer in the files, meaning a full
+    rebuild is needed. Revisions upstream to dates already stored are not picked
+    up here either, so rebuild fully after a historic correction.
+    """
+    header = pd.read_csv(dataset_path('confirmed'), nrows=0).columns
+    date_columns = [c for c in header if c not in ID_COLUMNS]
+    dates = parse_date_columns(date_columns)
+    stored_latest = pd.Timestamp(stored_latest)
+
+    seed_columns = [c for c, date in zip(date_columns, dates) if date == stored_latest]
+    new_columns = [c for c, date in zip(date_columns, dates) if date > stored_latest]
+    if not seed_columns:
+        return None
+    if not new_columns:
+        return pd.DataFrame(columns=COMBINED_COLUMNS)
+
+    def read_slice(data_type):
+        path = dataset_path(data_type)
+        available = pd.read_csv(path, nrows=0).columns
+        wanted = ID_COLUMNS + [c for c in seed_columns + new_columns if c in available]
+        return pd.read_csv(path, usecols=wanted)[wanted]
+
+    combined = combine_aligned(read_slice('confirmed'), read_slice('deaths'), read_slice('recovered'),
+                               compact=compact)
+    return combined[combined['Date'] > stored_latest].reset_index(drop=True)
+
+def create_combined_dataset(method='aligned', compact=True, export_csv=False, incremental=False):
+    """Create combined dataset from downloaded files
+
+    With incremental=True only dates newer than the stored dataset are built and
+    appended, falling back to a full build when there is nothing stored yet or
+    the stored data can no longer be continued. Rows use the compact schema of
+    combine_aligned (categorical locations, int32 counts) unless compact=False.
+    """
+    try:
+        if incremental and has_columnar():
+            with span('combine.incremental') as trace:
+                stored_latest = latest_date()
+                print(f"Updating combined dataset after {stored_latest:%Y-%m-%d}...")
+                new_rows = combine_new_dates(stored_latest, compact=compact)
+                if new_rows is not None:
+                    append_combined(new_rows, export_csv=export_csv)
+                    if new_rows.empty:
+                        print("Combined dataset already up to date")
+                    trace.rows_out = len(new_rows)
+                    return new_rows
+            print("Stored dataset cannot be continued, rebuilding from scratch")
+
+        with span('combine') as trace:
+            print("Creating combined dataset...")
+            
+            paths = [dataset_path(data_type) for data_type in DATASETS]
+            confirmed = pd.read_csv(dataset_path('confirmed'))
+            deaths = pd.read_csv(dataset_path('deaths'))
+            recovered = pd.read_csv(dataset_path('recovered'))
+            trace.bytes_read = sum(file_size(path) or 0 for path in paths)
+            
+            print("Loaded datasets successfully")
+            
+            if method == 'melt':
+                merged_df = combine_melted(confirmed, deaths, recovered)
+            else:
+                merged_df = combine_aligned(confirmed, deaths, recovered, compact=compact)
+            trace.rows_in = len(confirmed) + len(deaths) + len(recovered)
+            trace.rows_out = len(merged_df)
+            
+            # Save combined dataset
+            save_combined(merged_df, export_csv=export_csv)
         
         return merged_df
         
@@ -150,10 +573,10 @@ if __name__ == "__main__":
     print("=" * 50)
     
     if download_covid_data():
-        combined_data = create_combined_dataset()
+        combined_data = create_combined_dataset(incremental=True)
         if combined_data is not None:
             print("COVID-19 data processing completed successfully")
-            print(f"Total records: {len(combined_data)}")
+            print(f"Records written: {len(combined_data)}")
             print(f"Countries: {combined_data['Country/Region'].nunique()}")
         else:
             print("Failed to create combined dataset")